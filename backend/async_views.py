@@ -0,0 +1,172 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .attributes import filter_by_attributes
+from .catalog import CATALOG_SNAPSHOT_TTL, CATALOG_VERSION_KEY, catalog_offers, catalog_products
+from .carts import get_cart_store
+from .models import Cart
+from .reads import carts_with_items, orders_with_items
+from .serializers import CartSerializer, OrderSerializer, ProductInfoDetailSerializer, ProductSerializer
+
+User = get_user_model()
+
+# Асинхронные варианты горячих GET-запросов для запуска под ASGI
+# (uvicorn orders.asgi:application): запросы идут через асинхронный ORM
+# и кэш, ответы те же, что у синхронных вьюх, кроме пагинации — вместо
+# курсора DRF простой ?after=<id> со ссылкой next. Под WSGI они тоже
+# работают, но каждый запрос поднимает свой цикл событий.
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get('page_size', getattr(settings, 'API_PAGE_SIZE', 50)))
+    except ValueError:
+        size = 50
+    return max(1, min(size, 1000))
+
+
+def _after(request):
+    try:
+        return int(request.GET.get('after', 0))
+    except ValueError:
+        return 0
+
+
+def _page(request, rows, size, key='id'):
+    # строк читается на одну больше: так видно, есть ли следующая страница
+    following = None
+    if len(rows) > size:
+        rows = rows[:size]
+        params = request.GET.copy()
+        params['after'] = getattr(rows[-1], key)
+        following = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+    return rows, following
+
+
+async def _user(request):
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        # проверка подписи без базы, пользователь — одним асинхронным запросом
+        try:
+            token = AccessToken(header[len('Bearer '):])
+        except TokenError:
+            return None
+        return await User.objects.filter(
+            **{jwt_settings.USER_ID_FIELD: token.get(jwt_settings.USER_ID_CLAIM), 'is_active': True},
+        ).afirst()
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+async def _throttled(request, user):
+    # те же ограничения, что у DRF-вьюх; счетчики в кэше
+    request.user = user or AnonymousUser()
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, None):
+            return _json({'detail': 'Request was throttled.'}, status=429)
+    return None
+
+
+async def _authenticated(request):
+    user = await _user(request)
+    if user is None:
+        return None, _json({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+    return user, await _throttled(request, user)
+
+
+@require_GET
+async def product_list(request):
+    if response := await _throttled(request, await _user(request)):
+        return response
+    size, after = _page_size(request), _after(request)
+    # страница каталога живет в кэше до смены версии каталога
+    version = await cache.aget(CATALOG_VERSION_KEY, 1)
+    key = f'catalog:{version}:async:products:{request.get_host()}:{after}:{size}'
+    content = await cache.aget(key)
+    if content is None:
+        rows = [row async for row in catalog_products().filter(id__gt=after).order_by('id')[:size + 1]]
+        rows, following = _page(request, rows, size)
+        data = {'next': following, 'results': ProductSerializer(rows, many=True, context={'request': request}).data}
+        content = JSONRenderer().render(data)
+        await cache.aset(key, content, CATALOG_SNAPSHOT_TTL)
+    return HttpResponse(content, content_type='application/json')
+
+
+@require_GET
+async def product_detail(request, pk):
+    if response := await _throttled(request, await _user(request)):
+        return response
+    product = await catalog_products().filter(pk=pk).afirst()
+    if product is None:
+        return _json({'detail': 'Не найдено.'}, status=404)
+    return _json(ProductSerializer(product, context={'request': request}).data)
+
+
+@require_GET
+async def product_info_list(request):
+    if response := await _throttled(request, await _user(request)):
+        return response
+    size = _page_size(request)
+    params = [item.split(':', 1) for item in request.GET.getlist('param') if ':' in item]
+    offers = filter_by_attributes(catalog_offers(), params).filter(id__gt=_after(request)).order_by('id')
+    # ?shop=<id> — как в ProductInfoListView, нечисловой id фильтр не включает
+    shop = request.GET.get('shop', '')
+    if shop.isdigit():
+        offers = offers.filter(shop_id=int(shop))
+    rows, following = _page(request, [row async for row in offers[:size + 1]], size)
+    return _json({'next': following, 'results': ProductInfoDetailSerializer(rows, many=True).data})
+
+
+@require_GET
+async def order_list(request):
+    user, response = await _authenticated(request)
+    if response:
+        return response
+    size = _page_size(request)
+    orders = orders_with_items().filter(user=user).order_by('-id')
+    if after := _after(request):
+        # заказы идут от новых к старым, следующая страница — id меньше последнего
+        orders = orders.filter(id__lt=after)
+    rows, following = _page(request, [row async for row in orders[:size + 1]], size)
+    return _json({'next': following, 'results': OrderSerializer(rows, many=True).data})
+
+
+@require_GET
+async def order_detail(request, pk):
+    user, response = await _authenticated(request)
+    if response:
+        return response
+    order = await orders_with_items().filter(user=user, pk=pk).afirst()
+    if order is None:
+        return _json({'detail': 'Не найдено.'}, status=404)
+    return _json(OrderSerializer(order).data)
+
+
+@require_GET
+async def cart(request):
+    user, response = await _authenticated(request)
+    if response:
+        return response
+    if getattr(settings, 'CART_BACKEND', 'sql') != 'sql':
+        # Redis-корзина читается синхронным клиентом
+        return _json(await sync_to_async(get_cart_store(user).data)())
+    cart = await carts_with_items().filter(user=user).afirst()
+    if cart is None:
+        cart, _ = await Cart.objects.aget_or_create(user=user)
+        return _json({'id': cart.id, 'items': []})
+    return _json(CartSerializer(cart).data)
@@ -0,0 +1,88 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from .models import Parameter, ProductInfo, ProductParameter
+
+# Параметры предложений хранятся строками ProductParameter (EAV) и копией в
+# ProductInfo.attributes под GIN-индексом jsonb_path_ops: фильтр по любому
+# числу параметров — одно условие attributes @> {...} вместо JOIN на каждый.
+
+
+def offer_attributes(offer_ids):
+    attributes = {offer_id: {} for offer_id in offer_ids}
+    rows = ProductParameter.objects.filter(product_info_id__in=offer_ids).values_list(
+        'product_info_id', 'parameter__name', 'value',
+    )
+    for offer_id, name, value in rows:
+        attributes[offer_id][name] = value
+    return attributes
+
+
+def refresh_attributes(offer_ids, batch_size=1000):
+    """Пересобирает attributes предложений из их строк ProductParameter."""
+    offer_ids = list(offer_ids)
+    for i in range(0, len(offer_ids), batch_size):
+        chunk = offer_attributes(offer_ids[i:i + batch_size])
+        ProductInfo.objects.bulk_update(
+            [ProductInfo(id=offer_id, attributes=attributes) for offer_id, attributes in chunk.items()],
+            ['attributes'],
+        )
+
+
+def resolve_parameters(names, known=None):
+    """id параметров по названиям, недостающие создаются; known — кэш импорта."""
+    known = {} if known is None else known
+    missing = set(names) - known.keys()
+    if missing:
+        Parameter.objects.bulk_create([Parameter(name=name) for name in missing], ignore_conflicts=True)
+        known.update(Parameter.objects.filter(name__in=missing).values_list('name', 'id'))
+    return {name: known[name] for name in names}
+
+
+def write_parameters(offers, known=None):
+    """Приводит строки ProductParameter предложений к их attributes (для импорта)."""
+    if not offers:
+        return
+    ids = resolve_parameters({name for offer in offers for name in offer.attributes}, known)
+    # upsert сигналов не шлет; удаляются только пропавшие параметры
+    ProductParameter.objects.bulk_create(
+        [
+            ProductParameter(product_info_id=offer.id, parameter_id=ids[name], value=value)
+            for offer in offers
+            for name, value in offer.attributes.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product_info', 'parameter'],
+        update_fields=['value'],
+    )
+    wanted = {(offer.id, ids[name]) for offer in offers for name in offer.attributes}
+    rows = ProductParameter.objects.filter(product_info__in=[offer.id for offer in offers])
+    stale = [
+        row_id for row_id, offer_id, parameter_id in rows.values_list('id', 'product_info_id', 'parameter_id')
+        if (offer_id, parameter_id) not in wanted
+    ]
+    if stale:
+        ProductParameter.objects.filter(id__in=stale).delete()
+
+
+def filter_by_attributes(offers, params):
+    """Предложения, у которых есть все пары (название, значение) из params."""
+    wanted = defaultdict(set)
+    for name, value in params:
+        wanted[name].add(value)
+    if any(len(values) > 1 for values in wanted.values()):
+        # у предложения одно значение параметра
+        return offers.none()
+    wanted = {name: values.pop() for name, values in wanted.items()}
+    if not wanted:
+        return offers
+    if connection.features.supports_json_field_contains:
+        return offers.filter(attributes__contains=wanted)
+    # SQLite не умеет @>, там проверяем строки ProductParameter
+    for name, value in wanted.items():
+        offers = offers.filter(Exists(ProductParameter.objects.filter(
+            product_info=OuterRef('pk'), parameter__name=name, value=value,
+        )))
+    return offers
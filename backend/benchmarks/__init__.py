@@ -0,0 +1,7 @@
+"""
+Нагрузочные замеры API: тестовый каталог, сценарий покупателя по реальным
+маршрутам и отчет с перцентилями задержки. Запуск — команда benchmark_api.
+"""
+
+# префикс имен тестовых строк: замеры создают и удаляют только их
+BENCH_PREFIX = 'bench-'
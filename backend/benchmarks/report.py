@@ -0,0 +1,57 @@
+import json
+import math
+from collections import defaultdict
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу, values отсортированы."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Results:
+    """Замеры по маршрутам: код ответа, задержка в мс и число SQL-запросов (если известно)."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, route, status, ms, queries=None):
+        self.samples[route].append((status, ms, queries))
+
+    def merge(self, samples):
+        for route, rows in samples.items():
+            self.samples[route].extend(tuple(row) for row in rows)
+
+    def summary(self, elapsed, **meta):
+        routes = {}
+        total = 0
+        for route, rows in self.samples.items():
+            latencies = sorted(row[1] for row in rows)
+            queries = [row[2] for row in rows if row[2] is not None]
+            total += len(rows)
+            routes[route] = {
+                'requests': len(rows),
+                'errors': sum(1 for row in rows if row[0] >= 400),
+                'throttled': sum(1 for row in rows if row[0] == 429),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'mean_ms': round(sum(latencies) / len(latencies), 2),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+        orders = sum(1 for row in self.samples.get('orders/create', []) if row[0] == 201)
+        return {
+            'meta': meta,
+            'elapsed_s': round(elapsed, 3),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+            'orders_placed': orders,
+            'orders_per_sec': round(orders / elapsed, 1) if elapsed else None,
+            'routes': routes,
+        }
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,201 @@
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.throttling import SimpleRateThrottle
+
+from . import BENCH_PREFIX
+from .report import Results
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'bench-password-1'
+
+
+class TestClientDriver:
+    """Запросы через тестовый клиент Django в этом же процессе, с подсчетом SQL-запросов."""
+
+    def __init__(self):
+        self.client = Client()
+        self.headers = {}
+
+    def request(self, method, path, body=None):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.generic(
+                method, path, json.dumps(body) if body is not None else '',
+                content_type='application/json', headers=self.headers,
+            )
+            # потоковую выгрузку дочитываем до конца, иначе время и запросы не учтены
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, content, (time.perf_counter() - started) * 1000, len(queries)
+
+
+class HttpDriver:
+    """Запросы по HTTP к запущенному серверу через одно keep-alive соединение."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.connection = HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.prefix = parts.path.rstrip('/')
+        self.headers = {}
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json', **self.headers}
+        started = time.perf_counter()
+        self.connection.request(
+            method, self.prefix + path, json.dumps(body) if body is not None else None, headers=headers
+        )
+        response = self.connection.getresponse()
+        content = response.read()
+        return response.status, content, (time.perf_counter() - started) * 1000, None
+
+
+def run_user(driver, results, offer_ids, iterations=20, lines=2, export_every=10):
+    """
+    Сценарий покупателя: регистрация и токен, затем iterations раз — товар в
+    корзину, заказ, список заказов, страница каталога и иногда выгрузка.
+    """
+    def call(route, method, path, body=None):
+        status, content, ms, queries = driver.request(method, path, body)
+        results.record(route, status, ms, queries)
+        return status, content
+
+    username = f'{BENCH_PREFIX}api-{uuid.uuid4().hex[:12]}'
+    call('register', 'POST', reverse('register'), {
+        'username': username, 'email': f'{username}@bench.local', 'password': BENCH_PASSWORD,
+    })
+    # активация по ссылке из письма в замер не входит
+    User.objects.filter(username=username).update(is_active=True)
+    status, content = call('token', 'POST', reverse('token_obtain_pair'), {
+        'username': username, 'password': BENCH_PASSWORD,
+    })
+    if status != 200:
+        raise RuntimeError(f'Не удалось получить токен: {status} {content[:200]!r}')
+    driver.headers['Authorization'] = f'Bearer {json.loads(content)["access"]}'
+
+    for i in range(iterations):
+        offers = random.sample(offer_ids, lines)
+        call('cart/add', 'POST', reverse('add_to_cart'), {'product_info_id': offers[0], 'quantity': 1})
+        call('orders/create', 'POST', reverse('create_order'), {
+            'address': 'bench',
+            'products_info': [{'product_info_id': offer_id, 'quantity': 1} for offer_id in offers],
+        })
+        call('orders', 'GET', reverse('list_orders'))
+        call('products/list', 'GET', reverse('get_products'))
+        if export_every and i % export_every == 0:
+            call('export', 'GET', reverse('export-products') + '?stream=ndjson')
+
+
+@contextmanager
+def throttling_disabled():
+    # ставка None отключает ограничение; словарь общий с настройками DRF, поэтому восстанавливаем его
+    rates = SimpleRateThrottle.THROTTLE_RATES
+    saved = dict(rates)
+    rates.update({scope: None for scope in rates})
+    try:
+        yield
+    finally:
+        rates.clear()
+        rates.update(saved)
+
+
+def run_in_process(offer_ids, users=10, **scenario):
+    """Все покупатели по очереди через тестовый клиент, ограничение частоты запросов снято."""
+    results = Results()
+    started = time.perf_counter()
+    # тестовый клиент ходит на testserver; вне тестов этого хоста в ALLOWED_HOSTS нет
+    with throttling_disabled(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for _ in range(users):
+            run_user(TestClientDriver(), results, offer_ids, **scenario)
+    return results, time.perf_counter() - started
+
+
+def _init_worker():
+    # при запуске процессов через spawn Django в них еще не настроен
+    if not apps.ready:
+        django.setup()
+
+
+def _http_worker(base_url, offer_ids, users, scenario):
+    results = Results()
+    try:
+        for _ in range(users):
+            run_user(HttpDriver(base_url), results, offer_ids, **scenario)
+    finally:
+        connection.close()
+    return dict(results.samples)
+
+
+def run_http(base_url, offer_ids, users=10, processes=4, **scenario):
+    """
+    Покупатели распределяются по процессам и ходят на сервер по HTTP.
+    Ограничение частоты запросов на сервере нужно снять заранее: ответы 429
+    попадают в отчет отдельной графой.
+    """
+    processes = max(1, min(processes, users))
+    shares = [users // processes + (1 if i < users % processes else 0) for i in range(processes)]
+    # дочерние процессы открывают свои соединения с базой
+    connections.close_all()
+    results = Results()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        futures = [pool.submit(_http_worker, base_url, offer_ids, share, scenario) for share in shares]
+        for future in futures:
+            results.merge(future.result())
+    return results, time.perf_counter() - started
+
+
+def _read_connection(base_url, routes, headers, deadline):
+    # один keep-alive клиент: запросы подряд по случайным маршрутам до истечения времени
+    driver = HttpDriver(base_url)
+    driver.headers.update(headers)
+    results = Results()
+    while time.perf_counter() < deadline:
+        route = random.choice(list(routes))
+        status, content, ms, queries = driver.request('GET', random.choice(routes[route]))
+        results.record(route, status, ms, queries)
+    return results.samples
+
+
+def _clients_worker(base_url, routes, headers, clients, duration):
+    deadline = time.perf_counter() + duration
+    results = Results()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        futures = [pool.submit(_read_connection, base_url, routes, headers, deadline) for _ in range(clients)]
+        for future in futures:
+            results.merge(future.result())
+    return dict(results.samples)
+
+
+def run_connections(base_url, routes, headers=None, clients=64, duration=10, processes=4):
+    """
+    clients одновременных keep-alive соединений (потоки в processes
+    процессах) duration секунд читают маршруты routes — словарь
+    {название: [пути]}. Для сравнения серверов важна пропускная способность.
+    """
+    processes = max(1, min(processes, clients))
+    shares = [clients // processes + (1 if i < clients % processes else 0) for i in range(processes)]
+    connections.close_all()
+    results = Results()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(_clients_worker, base_url, routes, headers or {}, share, duration) for share in shares
+        ]
+        for future in futures:
+            results.merge(future.result())
+    # отсчет идет в рабочих процессах после их запуска, он и берется за время замера
+    return results, duration
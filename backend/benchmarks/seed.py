@@ -0,0 +1,46 @@
+import random
+
+from backend.catalog import bump_catalog_version
+from backend.benchmarks import BENCH_PREFIX
+from backend.models import Shop, Category, Product, ProductInfo
+from backend.offers import refresh_best_offers
+
+
+def seed_catalog(shops=5, products=1000, offers=2, stock=1_000_000, batch_size=5000):
+    """
+    Каталог для замеров: products товаров, у каждого offers предложений
+    из разных магазинов. Повторный запуск дополняет уже созданный каталог.
+    Возвращает id всех тестовых предложений.
+    """
+    Shop.objects.bulk_create([
+        Shop(name=f'{BENCH_PREFIX}api-shop-{i}', url='http://bench.local')
+        for i in range(shops)
+        if not Shop.objects.filter(name=f'{BENCH_PREFIX}api-shop-{i}').exists()
+    ])
+    shop_ids = list(Shop.objects.filter(name__startswith=f'{BENCH_PREFIX}api-shop-').values_list('id', flat=True))
+    Category.objects.bulk_create(
+        [Category(name=f'{BENCH_PREFIX}api-category-{i}') for i in range(20)], ignore_conflicts=True
+    )
+    categories = list(Category.objects.filter(name__startswith=f'{BENCH_PREFIX}api-category-'))
+    for category in categories:
+        category.shops.add(*shop_ids)
+
+    start = Product.objects.filter(name__startswith=f'{BENCH_PREFIX}api-product-').count()
+    for offset in range(start, products, batch_size):
+        size = min(batch_size, products - offset)
+        created = Product.objects.bulk_create([
+            Product(name=f'{BENCH_PREFIX}api-product-{offset + i}', category=random.choice(categories), price=100)
+            for i in range(size)
+        ])
+        ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop_id=shop_id, name=product.name[:50], quantity=stock, price=100, price_rrc=120)
+            for product in created
+            for shop_id in random.sample(shop_ids, min(offers, len(shop_ids)))
+        ])
+        refresh_best_offers([product.id for product in created], batch_size)
+
+    # bulk_create не шлет сигналы, снимки каталога сбрасываем сами
+    bump_catalog_version()
+    return list(
+        ProductInfo.objects.filter(product__name__startswith=f'{BENCH_PREFIX}api-product-').values_list('id', flat=True)
+    )
@@ -0,0 +1,246 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Cart, CartItem, ProductInfo
+from .reads import carts_with_items, cart_data, cart_items, product_info_data
+from .scoped_cache import cached, evict
+from .serializers import CartSerializer, ProductInfoSerializer
+
+CART_FLUSH_KEY = 'carts:flush-scheduled'
+CART_DIRTY_KEY = 'carts:dirty'
+# ключ с этим полем уже загружен из базы, пустая корзина тоже
+LOADED_FIELD = '_'
+
+# Корзина меняется через хранилище: SqlCartStore работает с таблицами
+# Cart/CartItem напрямую, RedisCartStore держит живые корзины в хэшах Redis
+# (поле — id предложения, значение — количество) и переносит их в таблицы
+# отложенно и при оформлении заказа. В Redis-корзине id позиции совпадает
+# с id предложения.
+
+
+class SqlCartStore:
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def _cart(self):
+        cart, _ = Cart.objects.get_or_create(user_id=self.user_id)
+        return cart
+
+    def add(self, product_info_id, quantity):
+        # количество только растет: уменьшают и удаляют позицию через update
+        if quantity <= 0:
+            return False
+        # количество прибавляется одним UPDATE, параллельные добавления не теряются
+        if self._increment(product_info_id, quantity):
+            return True
+        if not ProductInfo.objects.filter(id=product_info_id).exists():
+            return False
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=self._cart(), product_info_id=product_info_id, quantity=quantity)
+        except IntegrityError:
+            # позицию успел создать параллельный запрос
+            self._increment(product_info_id, quantity)
+        return True
+
+    def _increment(self, product_info_id, quantity):
+        items = CartItem.objects.filter(cart__user_id=self.user_id, product_info_id=product_info_id)
+        return self._changed(items.update(quantity=F('quantity') + quantity))
+
+    def _changed(self, count):
+        # UPDATE и DELETE по queryset сигналов не шлют, кэш корзины сбрасываем сами
+        if count:
+            evict('cart', self.user_id)
+        return count
+
+    def update(self, item_id, quantity):
+        items = CartItem.objects.filter(id=item_id, cart__user_id=self.user_id)
+        if quantity <= 0:
+            return self._changed(items.delete()[0]) > 0
+        return self._changed(items.update(quantity=quantity)) > 0
+
+    def remove(self, item_id):
+        return self._changed(CartItem.objects.filter(id=item_id, cart__user_id=self.user_id).delete()[0]) > 0
+
+    def _items(self):
+        cart = self._cart()
+        return cart.id, cart_items(cart.id)
+
+    def data(self):
+        if getattr(settings, 'API_FLAT_READS', True):
+            # состав корзины кэшируется по пользователю, цены и остатки читаются из базы
+            cart_id, items = cached('cart', self.user_id, 'items', self._items)
+            return cart_data(cart_id, items)
+        cart, _ = carts_with_items().get_or_create(user_id=self.user_id)
+        return CartSerializer(cart).data
+
+    def flush(self):
+        pass
+
+
+class RedisCartStore:
+    # Каждый скрипт начинается с загрузки: корзина, которой нет в Redis,
+    # заполняется строками из таблиц в том же вызове, что и меняет ее, так что
+    # параллельный запрос не попадет между загрузкой и изменением.
+    # ARGV: срок жизни ключа (0 — строки из базы не переданы), поле, количество,
+    # дальше пары «id предложения, количество» из таблиц. Без строк на пустом
+    # ключе скрипт возвращает -1, и вызов повторяется со строками.
+    LOAD_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            if ARGV[1] == '0' then
+                return -1
+            end
+            redis.call('HSET', KEYS[1], '%s', 1)
+            for i = 4, #ARGV, 2 do
+                redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+            end
+            redis.call('EXPIRE', KEYS[1], ARGV[1])
+        end
+    """ % LOADED_FIELD
+    ITEMS_SCRIPT = LOAD_SCRIPT + """
+        return redis.call('HGETALL', KEYS[1])
+    """
+    ADD_SCRIPT = LOAD_SCRIPT + """
+        redis.call('HINCRBY', KEYS[1], ARGV[2], ARGV[3])
+        return 1
+    """
+    # количество меняется только если позиция уже есть в корзине
+    UPDATE_SCRIPT = LOAD_SCRIPT + """
+        if redis.call('HEXISTS', KEYS[1], ARGV[2]) == 0 then
+            return 0
+        end
+        if tonumber(ARGV[3]) > 0 then
+            redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+        else
+            redis.call('HDEL', KEYS[1], ARGV[2])
+        end
+        return 1
+    """
+    REMOVE_SCRIPT = LOAD_SCRIPT + """
+        return redis.call('HDEL', KEYS[1], ARGV[2])
+    """
+
+    def __init__(self, user_id, redis=None):
+        if redis is None:
+            from django_redis import get_redis_connection
+            redis = get_redis_connection('default')
+        self.user_id = user_id
+        self.redis = redis
+        self.key = f'cart:{user_id}'
+
+    def _ttl(self):
+        return getattr(settings, 'CART_REDIS_TTL', 60 * 60 * 24 * 30)
+
+    def _run(self, script, field='', quantity=0):
+        # обычно корзина уже в Redis, и таблицы не читаются
+        result = self.redis.eval(script, 1, self.key, 0, field, quantity)
+        if result != -1:
+            return result
+        rows = CartItem.objects.filter(cart__user_id=self.user_id).values_list('product_info_id', 'quantity')
+        return self.redis.eval(
+            script, 1, self.key, self._ttl(), field, quantity, *(value for row in rows for value in row))
+
+    def _changed(self, pipe):
+        pipe.expire(self.key, self._ttl())
+        pipe.sadd(CART_DIRTY_KEY, self.user_id)
+        pipe.execute()
+        schedule_cart_flush()
+
+    def items(self):
+        values = self._run(self.ITEMS_SCRIPT)
+        return {
+            int(field): int(quantity)
+            for field, quantity in zip(values[::2], values[1::2])
+            if field.decode() != LOADED_FIELD
+        }
+
+    def add(self, product_info_id, quantity):
+        # как и в SqlCartStore: уменьшать количество можно только через update
+        if quantity <= 0 or not ProductInfo.objects.filter(id=product_info_id).exists():
+            return False
+        self._run(self.ADD_SCRIPT, product_info_id, quantity)
+        self._changed(self.redis.pipeline())
+        return True
+
+    def update(self, item_id, quantity):
+        if not self._run(self.UPDATE_SCRIPT, item_id, quantity):
+            return False
+        self._changed(self.redis.pipeline())
+        return True
+
+    def remove(self, item_id):
+        if not self._run(self.REMOVE_SCRIPT, item_id):
+            return False
+        self._changed(self.redis.pipeline())
+        return True
+
+    def data(self):
+        items = self.items()
+        cart, _ = Cart.objects.get_or_create(user_id=self.user_id)
+        if getattr(settings, 'API_FLAT_READS', True):
+            offers = product_info_data(items)
+        else:
+            offers = ProductInfo.objects.select_related('product__category', 'shop').prefetch_related(
+                'product__category__shops').in_bulk(items)
+            offers = {offer_id: ProductInfoSerializer(offer).data for offer_id, offer in offers.items()}
+        return {
+            'id': cart.id,
+            'items': [
+                {'id': offer_id, 'product_info': offers[offer_id], 'quantity': quantity}
+                for offer_id, quantity in sorted(items.items()) if offer_id in offers
+            ],
+        }
+
+    def flush(self):
+        """Переносит корзину из Redis в таблицы Cart/CartItem."""
+        items = self.items()
+        existing = set(ProductInfo.objects.filter(id__in=items).values_list('id', flat=True))
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user_id=self.user_id)
+            CartItem.objects.filter(cart=cart).exclude(product_info_id__in=existing).delete()
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_info_id=offer_id, quantity=items[offer_id]) for offer_id in existing],
+                update_conflicts=True,
+                unique_fields=['cart', 'product_info'],
+                update_fields=['quantity'],
+            )
+        evict('cart', self.user_id)
+        # предложения, удаленные из каталога, пропадают и из Redis
+        gone = set(items) - existing
+        if gone:
+            self.redis.hdel(self.key, *gone)
+
+
+CART_BACKENDS = {
+    'sql': SqlCartStore,
+    'redis': RedisCartStore,
+}
+
+
+def get_cart_store(user):
+    return CART_BACKENDS[getattr(settings, 'CART_BACKEND', 'sql')](user.id)
+
+
+def schedule_cart_flush():
+    delay = getattr(settings, 'CART_FLUSH_DELAY', 30)
+    if cache.add(CART_FLUSH_KEY, 1, timeout=delay * 10):
+        from .tasks import flush_carts
+        flush_carts.apply_async(countdown=delay)
+
+
+def flush_dirty_carts(batch_size=500, redis=None):
+    if redis is None:
+        from django_redis import get_redis_connection
+        redis = get_redis_connection('default')
+    # новые изменения после снятия флага запланируют следующий перенос
+    cache.delete(CART_FLUSH_KEY)
+    flushed = 0
+    while True:
+        user_ids = redis.spop(CART_DIRTY_KEY, batch_size)
+        if not user_ids:
+            return flushed
+        for user_id in user_ids:
+            RedisCartStore(int(user_id), redis).flush()
+            flushed += 1
@@ -0,0 +1,100 @@
+from django.core.cache import cache
+from django.db.models import Prefetch
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Product, ProductInfo, ProductParameter
+from .serializers import ProductSerializer, ProductInfoDetailSerializer
+
+CATALOG_VERSION_KEY = 'catalog:version'
+# снимки старых версий каталога просто доживают свой срок в Redis
+CATALOG_SNAPSHOT_TTL = 60 * 60 * 24
+
+
+# Запросы каталога сразу подгружают все, что нужно сериализаторам,
+# чтобы число запросов не зависело от числа товаров
+def catalog_products():
+    return Product.objects.select_related('category').prefetch_related('category__shops')
+
+
+def catalog_offers():
+    return ProductInfo.objects.select_related('product__category', 'shop').prefetch_related(
+        'product__category__shops',
+        Prefetch('parameters', queryset=ProductParameter.objects.select_related('parameter')),
+    )
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        return get_catalog_version()
+
+
+# Снимок каталога хранится сегментами: товары — по категориям, предложения —
+# по парам (магазин, категория). Сегмент — уже сериализованные JSON-объекты
+# через запятую, ответ собирается склейкой сегментов без обращения к базе.
+
+SNAPSHOTS = {
+    'products': {
+        'serializer': ProductSerializer,
+        'queryset': catalog_products,
+        'index': lambda: Product.objects.values_list('category_id').distinct(),
+        'filter': lambda category: {'category_id': category},
+    },
+    'offers': {
+        'serializer': ProductInfoDetailSerializer,
+        'queryset': catalog_offers,
+        'index': lambda: ProductInfo.objects.values_list('shop_id', 'product__category_id').distinct(),
+        'filter': lambda shop, category: {'shop_id': shop, 'product__category_id': category},
+    },
+}
+
+
+def _key(version, kind, *parts):
+    return ':'.join(['catalog', str(version), kind] + [str(part) for part in parts])
+
+
+def _index(version, kind):
+    key = _key(version, kind, 'index')
+    index = cache.get(key)
+    if index is None:
+        index = sorted(list(row) for row in SNAPSHOTS[kind]['index']())
+        cache.set(key, index, CATALOG_SNAPSHOT_TTL)
+    return [tuple(row) for row in index]
+
+
+def _build_segment(kind, parts):
+    snapshot = SNAPSHOTS[kind]
+    queryset = snapshot['queryset']().filter(**snapshot['filter'](*parts)).order_by('id')
+    encoder = JSONEncoder(ensure_ascii=False)
+    return ','.join(encoder.encode(row) for row in snapshot['serializer'](queryset, many=True).data)
+
+
+def render_snapshot(kind, version, shop=None, category=None):
+    """JSON-список товаров или предложений из снимка каталога указанной версии."""
+    # последний элемент сегмента всегда категория, у предложений первый — магазин
+    wanted = [
+        parts for parts in _index(version, kind)
+        if (category is None or parts[-1] == category) and (shop is None or kind != 'offers' or parts[0] == shop)
+    ]
+
+    keys = {parts: _key(version, kind, *parts) for parts in wanted}
+    segments = cache.get_many(keys.values())
+    missing = {}
+    for parts, key in keys.items():
+        if key not in segments:
+            segments[key] = missing[key] = _build_segment(kind, parts)
+    if missing:
+        cache.set_many(missing, CATALOG_SNAPSHOT_TTL)
+
+    body = ','.join(segments[keys[parts]] for parts in wanted if segments[keys[parts]])
+    return '[' + body + ']'
@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .catalog import bump_catalog_version
+from .importer import forget_feed_hashes
+from .models import Order, OrderItem, ProductInfo
+from .offers import schedule_best_offers
+from .scoped_cache import evict
+
+
+def place_order(user, address, lines):
+    """
+    Оформление заказа одной транзакцией: предложения читаются одним запросом
+    и блокируются по возрастанию id (одинаковый порядок блокировок у всех
+    заказов исключает взаимоблокировки), остатки проверяются и списываются,
+    позиции создаются через bulk_create. lines — пары (id предложения, количество).
+    """
+    quantities = defaultdict(int)
+    for product_info_id, quantity in lines:
+        quantities[product_info_id] += quantity
+
+    with transaction.atomic():
+        offers = {
+            offer.id: offer
+            for offer in ProductInfo.objects.select_for_update().filter(id__in=quantities).order_by('id')
+        }
+
+        missing = sorted(set(quantities) - offers.keys())
+        if missing:
+            raise serializers.ValidationError({'products_info': f'Товары не найдены: {missing}'})
+        short = sorted(offer_id for offer_id, offer in offers.items() if offer.quantity < quantities[offer_id])
+        if short:
+            raise serializers.ValidationError({'products_info': f'Недостаточно товара на складе: {short}'})
+
+        order = Order.objects.create(user=user, address=address)
+        for offer_id, offer in offers.items():
+            offer.quantity -= quantities[offer_id]
+        ProductInfo.objects.bulk_update(offers.values(), ['quantity'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=offer, shop_id=offer.shop_id, quantity=quantities[offer_id])
+            for offer_id, offer in offers.items()
+        ])
+        # остатки входят в снимок каталога, в лучшие предложения и в кэш предложений магазинов
+        transaction.on_commit(bump_catalog_version)
+        evict('offers', *{offer.shop_id for offer in offers.values()})
+        # списанный остаток вернет только повторный импорт, даже неизмененного прайс-листа
+        forget_feed_hashes({offer.shop_id for offer in offers.values()})
+        schedule_best_offers(offer.product_id for offer in offers.values())
+
+    return order
@@ -0,0 +1,64 @@
+import csv
+import io
+import zlib
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import ProductSerializer
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_COLUMNS = [
+    'id', 'name', 'description', 'price', 'category_id', 'category',
+    'image', 'created_at', 'updated_at'
+]
+
+
+def iter_chunks(queryset, size=EXPORT_CHUNK_SIZE):
+    # iterator() на PostgreSQL читает через серверный курсор, prefetch делается на каждую пачку
+    rows = queryset.iterator(chunk_size=size)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_ndjson(queryset, context=None):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for chunk in iter_chunks(queryset):
+        data = ProductSerializer(chunk, many=True, context=context).data
+        yield ''.join(encoder.encode(row) + '\n' for row in data)
+
+
+def export_csv(queryset, context=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue()
+
+    for chunk in iter_chunks(queryset):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in ProductSerializer(chunk, many=True, context=context).data:
+            category = row['category'] or {}
+            writer.writerow([
+                row['id'], row['name'], row['description'], row['price'], category.get('id'),
+                category.get('name'), row['image'], row['created_at'], row['updated_at']
+            ])
+        yield buffer.getvalue()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        # сбрасываем буфер после каждой пачки, чтобы клиент получал данные сразу
+        yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson', 'ndjson'),
+    'csv': (export_csv, 'text/csv', 'csv'),
+}
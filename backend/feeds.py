@@ -0,0 +1,240 @@
+import codecs
+import json
+import os
+
+import yaml
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+try:
+    from yaml import CSafeLoader as FeedLoader
+except ImportError:
+    from yaml import SafeLoader as FeedLoader
+
+FEED_FORMATS = ('yaml', 'json')
+# ключи шапки, которые нужны импортеру до первого товара
+HEADER_KEYS = ('shop', 'categories')
+
+
+class FeedError(ValueError):
+    pass
+
+
+def detect_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    return 'json' if ext == '.json' else 'yaml'
+
+
+def read_feed(stream, fmt='yaml'):
+    """
+    Потоковое чтение прайс-листа: возвращает шапку (shop, categories, ...)
+    и итератор по goods, который разбирает товары по одному, не загружая
+    весь файл в память. Если ключи шапки идут после goods (yaml.safe_dump
+    сортирует ключи), шапка перематываемого файла собирается отдельным
+    проходом без разбора товаров; в неперематываемом потоке это ошибка.
+    """
+    if fmt not in FEED_FORMATS:
+        raise FeedError(f'Неизвестный формат прайс-листа: {fmt}')
+    start = stream.tell() if stream.seekable() else None
+    header, goods = _split(_pairs(stream, fmt))
+    if goods is None or start is None or all(key in header for key in HEADER_KEYS):
+        return header, goods or iter(())
+
+    stream.seek(start)
+    header = dict(_pairs(stream, fmt, skip_goods=True))
+    stream.seek(start)
+    _, goods = _split(_pairs(stream, fmt), late_header=True)
+    return header, goods
+
+
+def _pairs(stream, fmt, skip_goods=False):
+    return _iter_json(stream, skip_goods) if fmt == 'json' else _iter_yaml(stream, skip_goods)
+
+
+def _split(pairs, late_header=False):
+    # шапка до goods и итератор товаров (None, если goods в файле нет);
+    # late_header — шапка уже собрана целиком, ключи после goods не ошибка
+    header = {}
+    for key, value in pairs:
+        if key == 'goods':
+            return header, _iter_goods(value, pairs, None if late_header else header)
+        header[key] = value
+    return header, None
+
+
+def _iter_goods(first, pairs, header):
+    yield first
+    for key, value in pairs:
+        if key == 'goods':
+            yield value
+        elif header is not None and key in HEADER_KEYS and key not in header:
+            raise FeedError(f"Секция '{key}' должна идти до goods")
+
+
+# YAML: разбираем поток событий и собираем узлы только для одного товара за раз
+
+def _iter_yaml(stream, skip_goods=False):
+    loader = FeedLoader(stream)
+    try:
+        loader.get_event()
+        if loader.check_event(yaml.StreamEndEvent):
+            return
+        loader.get_event()
+        if not loader.check_event(yaml.MappingStartEvent):
+            raise FeedError('Прайс-лист должен быть словарем')
+        loader.get_event()
+
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = loader.construct_document(_compose(loader, {}))
+            if key == 'goods' and skip_goods:
+                _skip(loader)
+            elif key == 'goods' and loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield 'goods', loader.construct_document(_compose(loader, {}))
+                loader.get_event()
+            elif key == 'goods':
+                raise FeedError('goods должен быть списком')
+            else:
+                yield key, loader.construct_document(_compose(loader, {}))
+    except yaml.YAMLError as e:
+        raise FeedError(str(e)) from e
+    finally:
+        loader.dispose()
+
+
+def _skip(loader):
+    # пропускает узел по событиям, не собирая его
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.SequenceStartEvent, yaml.MappingStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.SequenceEndEvent, yaml.MappingEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def _compose(loader, anchors):
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise FeedError(f'Неизвестный якорь {event.anchor}')
+        return anchors[event.anchor]
+
+    if isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(event, yaml.MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _compose(loader, anchors)
+            node.value.append((key, _compose(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        raise FeedError(f'Неожиданное событие YAML: {event}')
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+# JSON: инкрементальный разбор через raw_decode по буферу фиксированного размера
+
+class _JsonReader:
+    chunk_size = 64 * 1024
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = ''
+        while not chunk:
+            raw = self.stream.read(self.chunk_size)
+            if not raw:
+                self.eof = True
+                return False
+            # многобайтовый символ может разрезаться границей чанка
+            chunk = self.text_decoder.decode(raw) if isinstance(raw, bytes) else raw
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise FeedError(f"Ожидался '{char}' в JSON прайс-листе")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self.fill():
+                    continue
+                raise FeedError(str(e)) from e
+            # число могло оборваться на границе чанка
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_json(stream, skip_goods=False):
+    reader = _JsonReader(stream)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'goods' and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    value = reader.value()
+                    if not skip_goods:
+                        yield 'goods', value
+                    if reader.peek() == ']':
+                        reader.pos += 1
+                        break
+                    reader.expect(',')
+        elif key == 'goods':
+            raise FeedError('goods должен быть списком')
+        else:
+            yield key, reader.value()
+
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
@@ -0,0 +1,75 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _fingerprint(request):
+    # тело берем уже разобранным: сырой поток мог быть прочитан раньше (CSRF, multipart)
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def idempotent(view):
+    """
+    Повтор запроса с тем же заголовком Idempotency-Key получает сохраненный
+    ответ первого запроса, а не выполняет запись еще раз. Ключ действует
+    в пределах пользователя, метода и адреса; ответы 5xx не сохраняются.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, Request))
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return view(*args, **kwargs)
+
+        key = f'idempotency:{request.user.pk}:{request.method}:{request.path}:{idempotency_key}'
+        fingerprint = _fingerprint(request)
+
+        def replay():
+            stored = cache.get(key)
+            if stored is None:
+                return None
+            stored_fingerprint, status_code, data = stored
+            if stored_fingerprint != fingerprint:
+                return Response(
+                    {'error': 'Ключ идемпотентности уже использован с другим телом запроса'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            response = Response(data, status=status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        response = replay()
+        if response is not None:
+            return response
+        if not cache.add(f'{key}:lock', 1, timeout=60):
+            return Response(
+                {'error': 'Запрос с этим ключом идемпотентности еще выполняется'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        try:
+            # первый запрос мог завершиться, пока мы брали блокировку
+            response = replay()
+            if response is not None:
+                return response
+            response = view(*args, **kwargs)
+            if response.status_code < 500:
+                cache.set(
+                    key, (fingerprint, response.status_code, response.data),
+                    getattr(settings, 'IDEMPOTENCY_TTL', 60 * 60 * 24),
+                )
+            return response
+        finally:
+            cache.delete(f'{key}:lock')
+
+    return wrapper
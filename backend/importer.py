@@ -0,0 +1,431 @@
+import glob
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+import django
+from django.apps import apps
+from django.db import DatabaseError, connection, connections, transaction
+
+from .attributes import write_parameters
+from .catalog import bump_catalog_version
+from .feeds import read_feed, detect_format, FeedError
+from .models import Shop, Category, Product, ProductInfo
+from .offers import refresh_best_offers
+from .scoped_cache import evict
+
+# названия категорий на случай, если поставщик не прислал справочник categories
+DEFAULT_CATEGORY_NAMES = {
+    224: 'Смартфоны',
+    15: 'Аксессуары',
+    1: 'Flash-накопители',
+    5: 'Телевизоры'
+}
+
+DEFAULT_BATCH_SIZE = 1000
+
+OFFER_FIELDS = ('name', 'quantity', 'price', 'price_rrc')
+
+# длины строковых полей строки прайс-листа: товар, категория, предложение
+ROW_MAX_LENGTHS = {
+    'product': Product._meta.get_field('name').max_length,
+    'category': Category._meta.get_field('name').max_length,
+    'name': ProductInfo._meta.get_field('name').max_length,
+}
+
+# ключ advisory lock, под которым создаются общие для магазинов категории и товары
+CATALOG_LOCK_ID = 72430001
+
+
+def lock_catalog():
+    # параллельные импорты не должны создать одну и ту же категорию или товар дважды
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CATALOG_LOCK_ID])
+
+
+class ImportStats:
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.skipped = False
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def tick(self):
+        self.elapsed = time.monotonic() - self.started
+
+    @property
+    def rows_per_sec(self):
+        if not self.elapsed:
+            return 0.0
+        return self.processed / self.elapsed
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'failed': self.failed,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'removed': self.removed,
+            'skipped': self.skipped,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+class PriceListImporter:
+    """
+    Импорт прайс-листа магазина пачками: категории, товары и предложения
+    ищутся одним запросом на пачку и пишутся через bulk_create/bulk_update.
+    """
+
+    def __init__(self, shop_name, categories=None, batch_size=DEFAULT_BATCH_SIZE, on_progress=None):
+        self.shop, _ = Shop.objects.get_or_create(name=shop_name)
+        self.category_names = dict(DEFAULT_CATEGORY_NAMES)
+        for category in categories or []:
+            self.category_names[category['id']] = category['name']
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self.stats = ImportStats()
+        self._categories = {}
+        self._parameters = {}
+        self._seen = set()
+        self._changed = False
+
+    @classmethod
+    def from_data(cls, data, **kwargs):
+        """Импортер по шапке прайс-листа; шапка с ошибкой — FeedError, а не падение посреди импорта."""
+        shop = data.get('shop') or 'Default Shop'
+        if not isinstance(shop, str) or len(shop) > Shop._meta.get_field('name').max_length:
+            raise FeedError(f'Некорректное название магазина: {shop!r}')
+        categories = data.get('categories') or []
+        if not isinstance(categories, list):
+            raise FeedError('categories должен быть списком')
+        max_length = Category._meta.get_field('name').max_length
+        for category in categories:
+            if not (
+                isinstance(category, dict) and 'id' in category
+                and isinstance(category.get('name'), str) and 0 < len(category['name']) <= max_length
+            ):
+                raise FeedError(f'Некорректная категория в прайс-листе: {category!r}')
+        return cls(shop, categories, **kwargs)
+
+    def run(self, goods, sweep=False):
+        # sweep=True: прайс-лист полный, пропавшие из него предложения обнуляются
+        for batch in self._batches(goods):
+            self.import_batch(batch)
+        if sweep and not self.stats.failed:
+            self._sweep_removed()
+        self._publish()
+        self.stats.tick()
+        return self.stats
+
+    def prepare(self, goods):
+        # только создает недостающие категории и товары, каждая пачка коммитится сразу
+        for batch in self._batches(goods):
+            rows = [row for row in map(self._parse_row, batch) if row is not None]
+            if rows:
+                with transaction.atomic():
+                    categories = self._resolve_categories({row['category'] for row in rows})
+                    self._resolve_products(rows, categories)
+        self._publish()
+
+    def _batches(self, goods):
+        batch = []
+        for item in goods:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _publish(self):
+        # bulk-операции не шлют сигналы, поэтому версию каталога поднимаем сами
+        if self._changed:
+            transaction.on_commit(bump_catalog_version)
+            evict('offers', self.shop.id)
+            self._changed = False
+
+    def skip(self):
+        self.stats.skipped = True
+        self.stats.tick()
+        return self.stats
+
+    def import_batch(self, items):
+        # одна строка на товар: при повторе в пачке побеждает последняя
+        rows = {}
+        for item in items:
+            row = self._parse_row(item)
+            if row is None:
+                self.stats.failed += 1
+            else:
+                rows[row['product']] = row
+
+        if rows:
+            with transaction.atomic():
+                categories = self._resolve_categories({row['category'] for row in rows.values()})
+                products = self._resolve_products(rows.values(), categories)
+                self._write_offers(rows.values(), products)
+
+        self.stats.processed += len(items)
+        self.stats.tick()
+        if self.on_progress:
+            self.on_progress(self.stats)
+
+    def _parse_row(self, item):
+        try:
+            price = Decimal(str(item['price']))
+            price_rrc = item.get('price_rrc')
+            price_rrc = price if price_rrc is None else Decimal(str(price_rrc))
+            quantity = int(item.get('quantity', 0))
+            category_id = item['category']
+            name = item['name']
+            parameters = item.get('parameters')
+            # без ключа parameters параметры предложения не трогаем
+            attributes = None if parameters is None else {
+                str(key)[:50]: str(value)[:100] for key, value in parameters.items()
+            }
+        except (KeyError, TypeError, ValueError, AttributeError, InvalidOperation):
+            return None
+        if not name or quantity < 0:
+            return None
+
+        row = {
+            'product': str(name),
+            'category': self.category_names.get(category_id, f'Категория {category_id}'),
+            'name': str(item.get('model') or name),
+            'quantity': quantity,
+            'price': price,
+            'price_rrc': price_rrc,
+            'attributes': attributes,
+        }
+        # слишком длинная строка на PostgreSQL уронила бы всю пачку (DataError)
+        if any(len(row[key]) > max_length for key, max_length in ROW_MAX_LENGTHS.items()):
+            return None
+        return row
+
+    def _resolve_categories(self, names):
+        self._load_categories(names - self._categories.keys())
+        missing = names - self._categories.keys()
+        if missing:
+            lock_catalog()
+            # пока ждали блокировку, категории мог создать другой импорт
+            self._load_categories(missing)
+            new = [Category(name=name) for name in missing - self._categories.keys()]
+            for category in Category.objects.bulk_create(new):
+                self._categories[category.name] = category
+            self._changed = self._changed or bool(new)
+        return {name: self._categories[name] for name in names}
+
+    def _load_categories(self, names):
+        if names:
+            for category in Category.objects.filter(name__in=names).order_by('id'):
+                self._categories.setdefault(category.name, category)
+
+    def _resolve_products(self, rows, categories):
+        wanted = {row['product']: categories[row['category']] for row in rows}
+
+        products = {}
+        self._load_products(wanted, products)
+        if len(products) < len(wanted):
+            lock_catalog()
+            self._load_products([name for name in wanted if name not in products], products)
+
+        moved = []
+        for name, product in products.items():
+            if product.category_id != wanted[name].id:
+                product.category = wanted[name]
+                moved.append(product)
+        if moved:
+            # строки блокируются по возрастанию id: параллельные импорты не ждут друг друга по кругу
+            moved.sort(key=lambda product: product.id)
+            Product.objects.bulk_update(moved, ['category'], batch_size=self.batch_size)
+            self._changed = True
+
+        new = [
+            Product(name=name, category=category, description='')
+            for name, category in wanted.items() if name not in products
+        ]
+        for product in Product.objects.bulk_create(new, batch_size=self.batch_size):
+            products[product.name] = product
+        self._changed = self._changed or bool(new)
+        return products
+
+    def _load_products(self, names, products):
+        for product in Product.objects.filter(name__in=names).only('id', 'name', 'category_id').order_by('id'):
+            products.setdefault(product.name, product)
+
+    def _write_offers(self, rows, products):
+        existing = {
+            offer.product_id: offer
+            for offer in ProductInfo.objects.filter(
+                shop=self.shop,
+                product_id__in=[product.id for product in products.values()]
+            )
+        }
+
+        new, changed, parametrized = [], [], []
+        for row in rows:
+            product = products[row['product']]
+            self._seen.add(product.id)
+            offer = existing.get(product.id)
+            attributes = row['attributes']
+            if offer is None:
+                offer = ProductInfo(
+                    product=product, shop=self.shop, attributes=attributes or {},
+                    **{f: row[f] for f in OFFER_FIELDS},
+                )
+                new.append(offer)
+                if attributes:
+                    parametrized.append(offer)
+            elif any(getattr(offer, f) != row[f] for f in OFFER_FIELDS) or (
+                attributes is not None and offer.attributes != attributes
+            ):
+                for f in OFFER_FIELDS:
+                    setattr(offer, f, row[f])
+                if attributes is not None and offer.attributes != attributes:
+                    offer.attributes = attributes
+                    parametrized.append(offer)
+                changed.append(offer)
+            else:
+                self.stats.unchanged += 1
+
+        if new:
+            ProductInfo.objects.bulk_create(new, batch_size=self.batch_size)
+        if changed:
+            ProductInfo.objects.bulk_update(changed, OFFER_FIELDS + ('attributes',), batch_size=self.batch_size)
+        # строки ProductParameter — только у предложений с изменившимися параметрами
+        write_parameters(parametrized, self._parameters)
+        refresh_best_offers({offer.product_id for offer in new + changed})
+        self.stats.created += len(new)
+        self.stats.updated += len(changed)
+        self._changed = self._changed or bool(new or changed)
+
+    def _sweep_removed(self):
+        # удалить нельзя: на предложения ссылаются позиции заказов (PROTECT), поэтому обнуляем остаток
+        in_stock = ProductInfo.objects.filter(shop=self.shop, quantity__gt=0)
+        removed = list(set(in_stock.values_list('product_id', flat=True)) - self._seen)
+        for i in range(0, len(removed), self.batch_size):
+            chunk = removed[i:i + self.batch_size]
+            self.stats.removed += in_stock.filter(product_id__in=chunk).update(quantity=0)
+        refresh_best_offers(removed, self.batch_size)
+        self._changed = self._changed or bool(removed)
+
+
+def feed_fingerprint(stream):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def forget_feed_hashes(shop_ids):
+    """
+    Остатки или цены магазинов изменились не через импорт (заказы, админка):
+    следующий прайс-лист применяется, даже если файл не изменился.
+    """
+    # UPDATE без совпавших строк ничего не блокирует, поэтому заказы после первого его почти не замечают
+    Shop.objects.filter(id__in=list(shop_ids)).exclude(feed_hash='').update(feed_hash='')
+
+
+def import_stream(stream, fmt='yaml', force=False, sweep=True, **kwargs):
+    """
+    Потоковый импорт прайс-листа магазина из бинарного файла: в памяти не
+    больше одной пачки товаров. По умолчанию прайс-лист полный: пропавшие из
+    него предложения обнуляются, а если файл совпадает с последним
+    импортированным для магазина, товары не читаются и в базу ничего не пишется.
+    С sweep=False товары только добавляются и обновляются.
+    """
+    fingerprint = feed_fingerprint(stream)
+    header, goods = read_feed(stream, fmt)
+    importer = PriceListImporter.from_data(header, **kwargs)
+    if sweep and not force and importer.shop.feed_hash == fingerprint:
+        return importer.skip()
+
+    stats = importer.run(goods, sweep=sweep)
+    # после частичного импорта база уже не совпадает ни с одним полным файлом
+    Shop.objects.filter(pk=importer.shop.pk).update(feed_hash=fingerprint if sweep else '')
+    return stats
+
+
+def import_feed(path, fmt=None, **kwargs):
+    with open(path, 'rb') as f:
+        return import_stream(f, fmt or detect_format(path), **kwargs)
+
+
+def import_shop_feed(path, fmt=None, force=False, **kwargs):
+    """
+    Импорт прайс-листа для параллельной загрузки: общие категории и товары
+    создаются первым проходом с коммитом по пачкам, а предложения магазина
+    пишутся вторым проходом в одной транзакции — ошибка откатывает только этот магазин.
+    """
+    fmt = fmt or detect_format(path)
+    with open(path, 'rb') as f:
+        fingerprint = feed_fingerprint(f)
+        header, goods = read_feed(f, fmt)
+        importer = PriceListImporter.from_data(header, **kwargs)
+        if not force and importer.shop.feed_hash == fingerprint:
+            return importer.skip()
+        importer.prepare(goods)
+
+        f.seek(0)
+        _, goods = read_feed(f, fmt)
+        with transaction.atomic():
+            stats = importer.run(goods, sweep=True)
+            Shop.objects.filter(pk=importer.shop.pk).update(feed_hash=fingerprint)
+    return stats
+
+
+def collect_feeds(pattern):
+    # файл, каталог с прайс-листами или glob-шаблон
+    if os.path.isdir(pattern):
+        paths = [
+            os.path.join(pattern, name) for name in os.listdir(pattern)
+            if os.path.splitext(name)[1].lower() in ('.yaml', '.yml', '.json')
+        ]
+    elif glob.has_magic(pattern):
+        paths = glob.glob(pattern)
+    else:
+        paths = [pattern]
+    return sorted(paths)
+
+
+def _init_worker():
+    # при запуске процессов через spawn Django в них еще не настроен
+    if not apps.ready:
+        django.setup()
+
+
+def _import_worker(path, fmt, force, batch_size):
+    started = time.monotonic()
+    result = {'path': path, 'ok': True, 'error': '', 'stats': None}
+    try:
+        stats = import_shop_feed(path, fmt, force=force, batch_size=batch_size)
+        result['stats'] = stats.as_dict()
+    except (OSError, FeedError, DatabaseError) as e:
+        result.update(ok=False, error=str(e))
+    result['elapsed'] = round(time.monotonic() - started, 3)
+    return result
+
+
+def import_feeds(paths, fmt=None, force=False, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """Импорт нескольких прайс-листов в пуле процессов, результат — по одному словарю на файл."""
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        return [_import_worker(path, fmt, force, batch_size) for path in paths]
+
+    # дочерние процессы открывают свои соединения, общие сокеты с родителем недопустимы
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_import_worker, path, fmt, force, batch_size) for path in paths]
+        return [future.result() for future in futures]
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+
+from backend.benchmarks.report import save_report
+from backend.benchmarks.runner import run_http, run_in_process
+from backend.benchmarks.seed import seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер API по реальным маршрутам: регистрация и токен, корзина, оформление '
+        'и список заказов, каталог, выгрузка. По умолчанию через тестовый клиент в этом процессе '
+        '(с числом SQL-запросов), с --url — по HTTP из нескольких процессов. Тестовые данные '
+        'удаляются командой benchmark_lookups --cleanup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=5, help='Магазинов в тестовом каталоге')
+        parser.add_argument('--products', type=int, default=1000, help='Товаров в тестовом каталоге')
+        parser.add_argument('--offers', type=int, default=2, help='Предложений у каждого товара')
+        parser.add_argument('--users', type=int, default=10, help='Число покупателей')
+        parser.add_argument('--iterations', type=int, default=20, help='Циклов покупки на покупателя')
+        parser.add_argument('--lines', type=int, default=2, help='Позиций в заказе')
+        parser.add_argument('--export-every', type=int, default=10, help='Выгрузка каталога раз в N циклов, 0 — без нее')
+        parser.add_argument('--url', help='Адрес запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--processes', type=int, default=4, help='Процессов генератора нагрузки для --url')
+        parser.add_argument('--output', help='Сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        offer_ids = seed_catalog(options['shops'], options['products'], options['offers'])
+        scenario = {
+            'iterations': options['iterations'],
+            'lines': options['lines'],
+            'export_every': options['export_every'],
+        }
+        if options['url']:
+            results, elapsed = run_http(
+                options['url'], offer_ids, options['users'], options['processes'], **scenario
+            )
+        else:
+            results, elapsed = run_in_process(offer_ids, options['users'], **scenario)
+
+        report = results.summary(
+            elapsed,
+            mode='http' if options['url'] else 'test-client',
+            url=options['url'],
+            processes=options['processes'] if options['url'] else 1,
+            users=options['users'],
+            offers=len(offer_ids),
+            **scenario,
+        )
+        self.print_report(report)
+        if options['output']:
+            save_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f'Отчет сохранен в {options["output"]}'))
+
+    def print_report(self, report):
+        self.stdout.write(f'{"маршрут":<16}{"запросов":>9}{"ошибок":>8}{"p50":>9}{"p95":>9}{"p99":>9}{"SQL":>7}')
+        for route, row in report['routes'].items():
+            queries = '-' if row['queries_per_request'] is None else f'{row["queries_per_request"]:.1f}'
+            self.stdout.write(
+                f'{route:<16}{row["requests"]:>9}{row["errors"]:>8}'
+                f'{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}{queries:>7}'
+            )
+        self.stdout.write(
+            f'{report["requests"]} запросов за {report["elapsed_s"]:.2f} с — {report["throughput_rps"]} запросов/с, '
+            f'{report["orders_placed"]} заказов ({report["orders_per_sec"]} заказов/с)'
+        )
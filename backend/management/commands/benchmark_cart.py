@@ -0,0 +1,77 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend.carts import CART_BACKENDS
+from backend.benchmarks import BENCH_PREFIX
+from backend.models import Shop, Category, Product, ProductInfo, Cart
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер операций с корзиной (операций/с) для хранилищ sql и redis: параллельные клиенты '
+        'добавляют товары в одну корзину, в конце проверяется, что ни одно добавление не потерялось'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=CART_BACKENDS, action='append', help='По умолчанию все')
+        parser.add_argument('--clients', type=int, default=8, help='Число параллельных клиентов')
+        parser.add_argument('--ops', type=int, default=200, help='Операций на клиента')
+        parser.add_argument('--offers', type=int, default=20, help='Предложений в тестовом каталоге')
+        parser.add_argument('--read-ratio', type=float, default=0.2, help='Доля чтений корзины среди операций')
+
+    def handle(self, *args, **options):
+        offer_ids = self.seed(options['offers'])
+        user, _ = User.objects.get_or_create(username=f'{BENCH_PREFIX}cart-user')
+
+        for name in options['backend'] or CART_BACKENDS:
+            store_class = CART_BACKENDS[name]
+            Cart.objects.filter(user=user).delete()
+            if name == 'redis':
+                store_class(user.id).redis.delete(f'cart:{user.id}')
+
+            def client(_):
+                store = store_class(user.id)
+                added = 0
+                try:
+                    for _ in range(options['ops']):
+                        if random.random() < options['read_ratio']:
+                            store.data()
+                        else:
+                            store.add(random.choice(offer_ids), 1)
+                            added += 1
+                finally:
+                    connection.close()
+                return added
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+                added = sum(pool.map(client, range(options['clients'])))
+            elapsed = time.perf_counter() - started
+
+            store = store_class(user.id)
+            store.flush()
+            in_cart = sum(item['quantity'] for item in store.data()['items'])
+            total = options['clients'] * options['ops']
+            self.stdout.write(
+                f'{name:<6} {total / elapsed:10.1f} операций/с  ({elapsed:.2f} с), '
+                f'в корзине {in_cart} шт. из {added} добавленных'
+            )
+
+    def seed(self, count):
+        shop, _ = Shop.objects.get_or_create(name=f'{BENCH_PREFIX}shop', defaults={'url': 'http://bench.local'})
+        category, _ = Category.objects.get_or_create(name=f'{BENCH_PREFIX}cart')
+        offer_ids = []
+        for i in range(count):
+            product, _ = Product.objects.get_or_create(name=f'{BENCH_PREFIX}cart-product-{i}', category=category)
+            offer, _ = ProductInfo.objects.get_or_create(
+                product=product, shop=shop, defaults={'name': product.name[:50], 'quantity': 1000, 'price': 1, 'price_rrc': 1}
+            )
+            offer_ids.append(offer.id)
+        return offer_ids
@@ -0,0 +1,95 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.benchmarks import BENCH_PREFIX
+from backend.models import Shop, Category, Product, ProductInfo, Order, Cart
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер задержки горячих выборок (товар/категория по имени, предложение по товару и магазину, '
+        'заказы и корзина пользователя). Запустите до и после миграции с индексами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Сначала создать столько тестовых товаров')
+        parser.add_argument('--repeat', type=int, default=200, help='Сколько раз повторить каждую выборку')
+        parser.add_argument('--explain', action='store_true', help='Показать план запроса')
+        parser.add_argument('--cleanup', action='store_true', help='Удалить тестовые данные и выйти')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.cleanup()
+            return
+        if options['seed']:
+            self.seed(options['seed'])
+
+        products = list(Product.objects.filter(name__startswith=BENCH_PREFIX).values_list('id', 'name')[:10000])
+        if not products:
+            self.stderr.write('Нет тестовых данных, запустите с --seed 1000000')
+            return
+        shop = Shop.objects.get(name=f'{BENCH_PREFIX}shop')
+        user = User.objects.get(username=f'{BENCH_PREFIX}user')
+        category_names = list(Category.objects.filter(name__startswith=BENCH_PREFIX).values_list('name', flat=True))
+
+        lookups = {
+            'product by name': lambda: Product.objects.filter(name=random.choice(products)[1]),
+            'category by name': lambda: Category.objects.filter(name=random.choice(category_names)),
+            'offer by product+shop': lambda: ProductInfo.objects.filter(product_id=random.choice(products)[0], shop=shop),
+            'orders by user': lambda: Order.objects.filter(user=user).order_by('-created_at')[:50],
+            'cart by user': lambda: Cart.objects.filter(user=user),
+        }
+
+        for name, build in lookups.items():
+            timings = []
+            for _ in range(options['repeat']):
+                queryset = build()
+                started = time.perf_counter()
+                list(queryset)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{name:<24} avg {statistics.mean(timings):7.3f} ms  '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:7.3f} ms'
+            )
+            if options['explain']:
+                self.stdout.write(build().explain())
+
+    @transaction.atomic
+    def seed(self, count, batch_size=10000):
+        shop, _ = Shop.objects.get_or_create(name=f'{BENCH_PREFIX}shop', defaults={'url': 'http://bench.local'})
+        user, _ = User.objects.get_or_create(username=f'{BENCH_PREFIX}user')
+        Cart.objects.get_or_create(user=user)
+        Category.objects.bulk_create(
+            [Category(name=f'{BENCH_PREFIX}category-{i}') for i in range(100)], ignore_conflicts=True
+        )
+        categories = list(Category.objects.filter(name__startswith=BENCH_PREFIX))
+
+        start = Product.objects.filter(name__startswith=BENCH_PREFIX).count()
+        for offset in range(start, start + count, batch_size):
+            size = min(batch_size, start + count - offset)
+            products = Product.objects.bulk_create([
+                Product(name=f'{BENCH_PREFIX}product-{offset + i}', category=random.choice(categories))
+                for i in range(size)
+            ])
+            ProductInfo.objects.bulk_create([
+                ProductInfo(product=product, shop=shop, name=product.name[:50], quantity=1, price=1, price_rrc=1)
+                for product in products
+            ])
+            Order.objects.bulk_create([Order(user=user) for _ in range(size // 100)])
+            self.stdout.write(f'создано {offset + size - start} из {count}')
+
+    def cleanup(self):
+        # сначала пользователи с заказами: позиции заказов защищают предложения от удаления
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+        Product.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        Category.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        Shop.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        self.stdout.write(self.style.SUCCESS('Тестовые данные удалены'))
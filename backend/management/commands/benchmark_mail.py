@@ -0,0 +1,57 @@
+import time
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+
+from orders.tasks import build_messages
+
+BACKENDS = {
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Скорость отправки писем: отдельное соединение на каждое письмо против пачек через одно '
+        'соединение. Для SMTP поднимите локальную заглушку: python -m aiosmtpd -n -l localhost:1025'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Сколько писем отправить')
+        parser.add_argument('--batch-size', type=int, default=100, help='Писем на одно соединение')
+        parser.add_argument('--backend', choices=BACKENDS, default='locmem')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        notifications = [
+            {
+                'kind': 'email', 'subject': f'Заказ #{i}', 'message': 'Ваш заказ успешно подтвержден.',
+                'from_email': 'bench@example.ru', 'to': [f'user{i}@example.ru'],
+            }
+            for i in range(options['messages'])
+        ]
+        connection_options = {'backend': BACKENDS[options['backend']]}
+        if options['backend'] == 'smtp':
+            connection_options.update(host=options['host'], port=options['port'], use_tls=False, use_ssl=False)
+        else:
+            mail.outbox = []
+
+        def one_by_one():
+            for item in notifications:
+                message = EmailMultiAlternatives(item['subject'], item['message'], item['from_email'], item['to'])
+                get_connection(**connection_options).send_messages([message])
+
+        def batched():
+            size = options['batch_size']
+            for start in range(0, len(notifications), size):
+                with get_connection(**connection_options) as connection:
+                    connection.send_messages(build_messages(notifications[start:start + size]))
+
+        for name, run in (('one connection per message', one_by_one), ('batched', batched)):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{name:<28} {len(notifications) / elapsed:10.1f} msg/s  ({elapsed:.2f} s)')
@@ -0,0 +1,73 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework import serializers
+
+from backend.checkout import place_order
+from backend.benchmarks import BENCH_PREFIX
+from backend.models import Shop, Category, Product, ProductInfo
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Замер оформления заказов (заказов/с) параллельными клиентами на тестовом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8, help='Число параллельных клиентов')
+        parser.add_argument('--orders', type=int, default=100, help='Заказов на клиента')
+        parser.add_argument('--offers', type=int, default=50, help='Предложений в тестовом каталоге')
+        parser.add_argument('--lines', type=int, default=3, help='Позиций в заказе')
+        parser.add_argument('--stock', type=int, default=1000, help='Начальный остаток каждого предложения')
+
+    def handle(self, *args, **options):
+        offer_ids = self.seed(options['offers'], options['stock'])
+        users = [
+            User.objects.get_or_create(username=f'{BENCH_PREFIX}client-{i}')[0]
+            for i in range(options['clients'])
+        ]
+
+        def client(user):
+            placed = rejected = 0
+            try:
+                for _ in range(options['orders']):
+                    lines = [(offer_id, 1) for offer_id in random.sample(offer_ids, options['lines'])]
+                    try:
+                        place_order(user, 'bench', lines)
+                        placed += 1
+                    except serializers.ValidationError:
+                        rejected += 1
+            finally:
+                connection.close()
+            return placed, rejected
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+            results = list(pool.map(client, users))
+        elapsed = time.perf_counter() - started
+
+        placed = sum(result[0] for result in results)
+        rejected = sum(result[1] for result in results)
+        left = ProductInfo.objects.filter(id__in=offer_ids).values_list('quantity', flat=True)
+        sold = options['stock'] * len(offer_ids) - sum(left)
+        self.stdout.write(
+            f'{placed} заказов за {elapsed:.2f} с — {placed / elapsed:.1f} заказов/с, '
+            f'отказов из-за остатков {rejected}'
+        )
+        self.stdout.write(f'Списано {sold} шт., ожидалось {placed * options["lines"]}')
+
+    def seed(self, count, stock):
+        shop, _ = Shop.objects.get_or_create(name=f'{BENCH_PREFIX}shop', defaults={'url': 'http://bench.local'})
+        category, _ = Category.objects.get_or_create(name=f'{BENCH_PREFIX}orders')
+        offer_ids = []
+        for i in range(count):
+            product, _ = Product.objects.get_or_create(name=f'{BENCH_PREFIX}order-product-{i}', category=category)
+            offer, _ = ProductInfo.objects.update_or_create(
+                product=product, shop=shop, defaults={'name': product.name[:50], 'quantity': stock, 'price': 1, 'price_rrc': 1}
+            )
+            offer_ids.append(offer.id)
+        return offer_ids
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend.benchmarks.report import percentile
+from backend.benchmarks.seed import seed_catalog
+from backend.benchmarks import BENCH_PREFIX
+from backend.models import Category, Product, Shop
+from backend.search import search_offers
+
+
+class Command(BaseCommand):
+    help = (
+        'Задержка поиска предложений (страница результатов и фасеты, как в /api/search/): по тексту, '
+        'с опечаткой, по фильтрам. Полнотекстовый и нечеткий поиск — только на PostgreSQL. '
+        'Тестовые данные удаляются командой benchmark_lookups --cleanup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=0, help='Сначала дополнить тестовый каталог до N товаров')
+        parser.add_argument('--offers', type=int, default=2, help='Предложений у каждого нового товара')
+        parser.add_argument('--repeat', type=int, default=200, help='Запросов на каждый сценарий')
+
+    def handle(self, *args, **options):
+        if options['products']:
+            seed_catalog(shops=10, products=options['products'], offers=options['offers'])
+        names = list(Product.objects.filter(name__startswith=BENCH_PREFIX).values_list('name', flat=True)[:10000])
+        if not names:
+            self.stderr.write('Нет тестовых данных, запустите с --products 500000')
+            return
+        categories = list(Category.objects.filter(name__startswith=BENCH_PREFIX).values_list('id', flat=True))
+        shops = list(Shop.objects.filter(name__startswith=BENCH_PREFIX).values_list('id', flat=True))
+
+        scenarios = {
+            'filters': lambda: {'categories': [random.choice(categories)], 'shops': [random.choice(shops)], 'price_min': 50},
+        }
+        if connection.vendor == 'postgresql':
+            scenarios['text'] = lambda: {'q': random.choice(names)}
+            # опечатка: последний символ заменен, полнотекстовый поиск ничего не найдет
+            scenarios['typo'] = lambda: {'q': random.choice(names)[:-1] + 'ъ'}
+
+        self.stdout.write(f'{"сценарий":<10}{"p50":>9}{"p95":>9}{"p99":>9}  мс')
+        for name, build in scenarios.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                found = search_offers(**build())
+                list(found['results'])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{name:<10}{percentile(timings, 50):>9.1f}{percentile(timings, 95):>9.1f}{percentile(timings, 99):>9.1f}'
+            )
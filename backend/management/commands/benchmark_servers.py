@@ -0,0 +1,100 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from backend.benchmarks.report import save_report
+from backend.benchmarks.runner import run_connections
+from backend.benchmarks.seed import seed_catalog
+from backend.benchmarks import BENCH_PREFIX
+from backend.models import Order, OrderItem, ProductInfo
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Пропускная способность чтений при множестве одновременных соединений: WSGI-сервер '
+        '(gunicorn orders.wsgi) на обычных маршрутах и ASGI-сервер (uvicorn orders.asgi) на '
+        'асинхронных /api/async/. Серверы запускаются заранее на той же машине с той же базой, '
+        'ограничение частоты запросов на них нужно снять. Тестовые данные удаляются командой '
+        'benchmark_lookups --cleanup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', help='Адрес WSGI-сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='Адрес ASGI-сервера, например http://127.0.0.1:8001')
+        parser.add_argument('--connections', type=int, default=64, help='Одновременных соединений')
+        parser.add_argument('--duration', type=float, default=20, help='Секунд на каждый сервер')
+        parser.add_argument('--processes', type=int, default=4, help='Процессов генератора нагрузки')
+        parser.add_argument('--products', type=int, default=1000, help='Товаров в тестовом каталоге')
+        parser.add_argument('--output', help='Сохранить отчет в JSON')
+
+    def handle(self, *args, **options):
+        if not options['wsgi_url'] and not options['asgi_url']:
+            raise CommandError('Укажите --wsgi-url и/или --asgi-url')
+        offer_ids = seed_catalog(products=options['products'])
+        offers = ProductInfo.objects.filter(id__in=random.sample(offer_ids, min(50, len(offer_ids))))
+        product_ids = list(offers.values_list('product_id', flat=True))
+
+        user, created = User.objects.get_or_create(
+            username=f'{BENCH_PREFIX}servers', defaults={'email': f'{BENCH_PREFIX}servers@bench.local', 'is_active': True},
+        )
+        if created:
+            # без заказов списки и карточки заказов пусты
+            for offer in offers[:10]:
+                order = Order.objects.create(user=user, address='bench')
+                OrderItem.objects.create(order=order, product=offer, shop_id=offer.shop_id, quantity=1)
+        orders = list(Order.objects.filter(user=user).values_list('id', flat=True))
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+        servers = {
+            'wsgi': (options['wsgi_url'], {
+                'products': [reverse('product-list')],
+                'product': [reverse('product-detail', args=[pk]) for pk in product_ids],
+                'product-info': [reverse('product_info_list')],
+                'orders': [reverse('list_orders')],
+                'order': [reverse('order-detail', args=[pk]) for pk in orders],
+                'cart': [reverse('get_cart')],
+            }),
+            'asgi': (options['asgi_url'], {
+                'products': [reverse('async_product_list')],
+                'product': [reverse('async_product_detail', args=[pk]) for pk in product_ids],
+                'product-info': [reverse('async_product_info_list')],
+                'orders': [reverse('async_order_list')],
+                'order': [reverse('async_order_detail', args=[pk]) for pk in orders],
+                'cart': [reverse('async_cart')],
+            }),
+        }
+        report = {}
+        for name, (url, routes) in servers.items():
+            if not url:
+                continue
+            results, elapsed = run_connections(
+                url, routes, headers, options['connections'], options['duration'], options['processes'],
+            )
+            report[name] = results.summary(
+                elapsed, url=url, connections=options['connections'], processes=options['processes'],
+            )
+            self.print_report(name, report[name])
+
+        if len(report) == 2 and report['wsgi']['throughput_rps']:
+            ratio = report['asgi']['throughput_rps'] / report['wsgi']['throughput_rps']
+            self.stdout.write(f'ASGI / WSGI по пропускной способности: {ratio:.2f}')
+        if options['output']:
+            save_report(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f'Отчет сохранен в {options["output"]}'))
+
+    def print_report(self, name, report):
+        self.stdout.write(f'{name}: {report["meta"]["url"]}')
+        self.stdout.write(f'{"маршрут":<16}{"запросов":>9}{"ошибок":>8}{"p50":>9}{"p95":>9}{"p99":>9}')
+        for route, row in report['routes'].items():
+            self.stdout.write(
+                f'{route:<16}{row["requests"]:>9}{row["errors"]:>8}'
+                f'{row["p50_ms"]:>9.1f}{row["p95_ms"]:>9.1f}{row["p99_ms"]:>9.1f}'
+            )
+        self.stdout.write(
+            f'{report["requests"]} запросов за {report["elapsed_s"]:.2f} с — {report["throughput_rps"]} запросов/с'
+        )
@@ -0,0 +1,94 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+
+from backend.models import (
+    Shop,
+    BestOffer,
+    Category,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    OrderItem,
+    Cart,
+    CartItem
+)
+
+
+def duplicates(model, fields):
+    """Группы дублей по полям: (id, который оставляем, [id дублей])."""
+    groups = (
+        model.objects.values(*fields)
+        .annotate(total=Count('id'), keep=Min('id'))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        keep = group.pop('keep')
+        group.pop('total')
+        ids = model.objects.filter(**group).exclude(id=keep).values_list('id', flat=True)
+        yield keep, list(ids)
+
+
+def delete(model, ids):
+    return model.objects.filter(id__in=ids).delete()[1].get(model._meta.label, 0)
+
+
+class Command(BaseCommand):
+    help = 'Сливает дубли в каталоге и корзинах перед добавлением уникальных ограничений'
+
+    @transaction.atomic
+    def handle(self, *args, **kwargs):
+        merged = Counter()
+
+        # магазины первыми: их предложения одного товара сливаются ниже вместе с остальными
+        for keep, ids in duplicates(Shop, ['name']):
+            for category in Category.objects.filter(shops__id__in=ids).distinct():
+                category.shops.add(keep)
+            ProductInfo.objects.filter(shop_id__in=ids).update(shop_id=keep)
+            OrderItem.objects.filter(shop_id__in=ids).update(shop_id=keep)
+            BestOffer.objects.filter(shop_id__in=ids).update(shop_id=keep)
+            merged['shops'] += delete(Shop, ids)
+
+        for keep, ids in duplicates(Category, ['name']):
+            category = Category.objects.get(id=keep)
+            category.shops.add(*Category.shops.through.objects.filter(
+                category_id__in=ids).values_list('shop_id', flat=True))
+            Product.objects.filter(category_id__in=ids).update(category_id=keep)
+            merged['categories'] += delete(Category, ids)
+
+        for keep, ids in duplicates(Parameter, ['name']):
+            ProductParameter.objects.filter(parameter_id__in=ids).update(parameter_id=keep)
+            merged['parameters'] += delete(Parameter, ids)
+
+        # предложения переезжают на оставшийся товар, совпавшие предложения сливаются ниже
+        for keep, ids in duplicates(Product, ['name']):
+            ProductInfo.objects.filter(product_id__in=ids).update(product_id=keep)
+            merged['products'] += delete(Product, ids)
+
+        for keep, ids in duplicates(ProductInfo, ['product', 'shop']):
+            OrderItem.objects.filter(product_id__in=ids).update(product_id=keep)
+            CartItem.objects.filter(product_info_id__in=ids).update(product_info_id=keep)
+            ProductParameter.objects.filter(product_info_id__in=ids).update(product_info_id=keep)
+            merged['offers'] += delete(ProductInfo, ids)
+
+        for keep, ids in duplicates(ProductParameter, ['product_info', 'parameter']):
+            merged['product parameters'] += delete(ProductParameter, ids)
+
+        for keep, ids in duplicates(Cart, ['user']):
+            CartItem.objects.filter(cart_id__in=ids).update(cart_id=keep)
+            merged['carts'] += delete(Cart, ids)
+
+        # одинаковые позиции корзины складываются в одну
+        for keep, ids in duplicates(CartItem, ['cart', 'product_info']):
+            extra = CartItem.objects.filter(id__in=ids).aggregate(total=Sum('quantity'))['total']
+            item = CartItem.objects.get(id=keep)
+            item.quantity += extra
+            item.save(update_fields=['quantity'])
+            merged['cart items'] += delete(CartItem, ids)
+
+        for name, count in merged.items():
+            self.stdout.write(f'{name}: удалено дублей {count}')
+        self.stdout.write(self.style.SUCCESS('Дубли слиты, можно применять миграции с уникальными ограничениями'))
@@ -1,48 +1,47 @@
-import yaml
-from django.core.management.base import BaseCommand
-from backend.models import Product, Category, ProductInfo, Shop
+from django.core.management.base import BaseCommand, CommandError
+from backend.feeds import FEED_FORMATS
+from backend.importer import import_feeds, collect_feeds, DEFAULT_BATCH_SIZE
 
 class Command(BaseCommand):
-    help = 'Импорт товаров из YAML'
+    help = 'Импорт товаров из YAML/JSON прайс-листов'
 
-    def handle(self, *args, **kwargs):
-        path = '/home/admin1/Рабочий стол/my_project/shop1.yaml'
-        with open(path, 'r', encoding='utf-8') as f:
-            data = yaml.safe_load(f)
-
-        for item in data['goods']:
-            category_id = item['category']
-
-            category_name_map = {
-                224: 'Смартфоны',
-                15: 'Аксессуары',
-                1: 'Flash-накопители',
-                5: 'Телевизоры'
-            }
-            category_name = category_name_map.get(category_id, f'Категория {category_id}')
-            category, created = Category.objects.get_or_create(name=category_name)
-
-            product_name = item['name']
-            description = ''
-            price = item['price']
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл, каталог или glob-шаблон прайс-листов')
+        parser.add_argument('--format', choices=FEED_FORMATS, help='Формат файлов (по умолчанию по расширению)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, help='Число процессов (по умолчанию по числу CPU)')
+        parser.add_argument('--force', action='store_true', help='Импортировать, даже если прайс-лист не изменился')
 
-            product, created = Product.objects.get_or_create(
-                name=product_name,
-                defaults={'category': category, 'description': description}
-            )
-
-            shop_name = data.get('shop', 'Default Shop')
-            shop, _ = Shop.objects.get_or_create(name=shop_name)
-
-            ProductInfo.objects.update_or_create(
-                product=product,
-                shop=shop,
-                defaults={
-                    'name': product_name,
-                    'quantity': item.get('quantity', 0),
-                    'price': price,
-                    'price_rrc': item.get('price_rrc', price)
-                }
-            )
-
-        self.stdout.write(self.style.SUCCESS('Импорт завершен'))
\ No newline at end of file
+    def handle(self, *args, **kwargs):
+        paths = collect_feeds(kwargs['path'])
+        if not paths:
+            raise CommandError(f'Не найдено прайс-листов: {kwargs["path"]}')
+
+        results = import_feeds(
+            paths,
+            kwargs['format'],
+            force=kwargs['force'],
+            batch_size=kwargs['batch_size'],
+            workers=kwargs['workers'],
+        )
+
+        for result in results:
+            stats = result['stats']
+            if not result['ok']:
+                self.stdout.write(self.style.ERROR(
+                    f'{result["path"]}: ошибка за {result["elapsed"]:.2f} с — {result["error"]}'
+                ))
+            elif stats['skipped']:
+                self.stdout.write(f'{result["path"]}: не изменился с прошлого импорта')
+            else:
+                self.stdout.write(
+                    f'{result["path"]}: {stats["processed"]} строк за {result["elapsed"]:.2f} с '
+                    f'({stats["rows_per_sec"]} строк/с), ошибок {stats["failed"]}, '
+                    f'новых {stats["created"]}, изменено {stats["updated"]}, '
+                    f'без изменений {stats["unchanged"]}, снято с продажи {stats["removed"]}'
+                )
+
+        failed = sum(1 for result in results if not result['ok'])
+        if failed:
+            raise CommandError(f'Импорт завершен с ошибками: {failed} из {len(results)} прайс-листов')
+        self.stdout.write(self.style.SUCCESS(f'Импорт завершен: {len(results)} прайс-листов'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from backend.attributes import refresh_attributes
+from backend.models import ProductInfo
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ProductInfo.attributes из строк ProductParameter. Поле заполняет миграция 0006, '
+        'дальше копию поддерживают импорт и сигналы; команда — для починки после правок в обход них.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                ProductInfo.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            refresh_attributes(ids, batch_size)
+            last_id = ids[-1]
+            total += len(ids)
+        self.stdout.write(self.style.SUCCESS(f'Обновлено предложений: {total}'))
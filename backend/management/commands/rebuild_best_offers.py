@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import Product
+from backend.offers import refresh_best_offers
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает лучшие предложения (BestOffer) всех товаров. Таблицу заполняет миграция 0007, '
+        'дальше ее поддерживают импорт, заказы и сигналы; команда — для починки после правок в обход них.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            refresh_best_offers(ids, batch_size)
+            last_id = ids[-1]
+            total += len(ids)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано товаров: {total}'))
@@ -0,0 +1,89 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from backend.metrics import counters, parse_series
+
+FIELDS = ('published', 'started', 'success', 'failure', 'retry', 'runtime', 'wait')
+
+
+def task_summary(values):
+    """Счетчики celery_* из снимка метрик, сведенные по задачам."""
+    tasks = defaultdict(lambda: dict.fromkeys(FIELDS, 0.0))
+    for series, value in values.items():
+        if not series.startswith('celery_'):
+            continue
+        name, labels = parse_series(series)
+        row = tasks[labels.get('task', '')]
+        if name == 'celery_tasks_published_total':
+            row['published'] += value
+        elif name == 'celery_tasks_started_total':
+            row['started'] += value
+        elif name == 'celery_task_runtime_seconds_total':
+            row['runtime'] += value
+        elif name == 'celery_task_queue_wait_seconds_total':
+            row['wait'] += value
+        elif name == 'celery_tasks_total' and labels.get('state', '').lower() in FIELDS:
+            row[labels['state'].lower()] += value
+    return dict(tasks)
+
+
+def queue_length(queue):
+    """Сообщений в очереди брокера или None, если брокер недоступен."""
+    from orders.celery import app
+    try:
+        with app.connection_for_read() as conn:
+            # без ограничения kombu переподключается бесконечно
+            conn.ensure_connection(max_retries=1)
+            return conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводка по задачам Celery из счетчиков /metrics: поставлено, начато, успешно, с ошибкой, '
+        'повторы, сколько ждут в очереди, среднее время выполнения и ожидания, скорость. '
+        'Обновляется каждые --interval секунд.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5, help='Период обновления в секундах')
+        parser.add_argument('--once', action='store_true', help='Вывести сводку один раз и выйти')
+        parser.add_argument('--queue', default='celery', help='Очередь брокера, длину которой показать')
+
+    def handle(self, *args, **options):
+        previous = None
+        while True:
+            summary = task_summary(counters.snapshot())
+            self.print_summary(summary, previous, options['interval'], queue_length(options['queue']), options['queue'])
+            if options['once']:
+                return
+            previous = summary
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
+
+    def print_summary(self, summary, previous, interval, backlog, queue):
+        self.stdout.write(
+            f'{"задача":<40}{"постав.":>8}{"начато":>8}{"успех":>8}{"ошибок":>8}{"повтор":>8}'
+            f'{"ждут":>7}{"вып., мс":>10}{"ожид., мс":>11}{"в сек":>7}'
+        )
+        for task, row in sorted(summary.items()):
+            finished = row['success'] + row['failure'] + row['retry']
+            runtime = row['runtime'] / finished * 1000 if finished else 0
+            wait = row['wait'] / row['started'] * 1000 if row['started'] else 0
+            # задачи, поставленные в очередь, но еще не начатые (до перезапуска счетчиков)
+            waiting = max(row['published'] - row['started'], 0)
+            rate = '-'
+            if previous is not None:
+                before = previous.get(task, dict.fromkeys(FIELDS, 0.0))
+                done_before = before['success'] + before['failure'] + before['retry']
+                rate = f'{(finished - done_before) / interval:.1f}'
+            self.stdout.write(
+                f'{task[-40:]:<40}{row["published"]:>8.0f}{row["started"]:>8.0f}{row["success"]:>8.0f}'
+                f'{row["failure"]:>8.0f}{row["retry"]:>8.0f}{waiting:>7.0f}{runtime:>10.1f}{wait:>11.1f}{rate:>7}'
+            )
+        self.stdout.write(f'В очереди {queue}: {"брокер недоступен" if backlog is None else backlog}\n')
@@ -0,0 +1,272 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.renderers import JSONRenderer
+
+# Счетчики копятся в памяти процесса и раз в METRICS_FLUSH_INTERVAL секунд
+# одним pipeline складываются в хэш Redis, общий для всех процессов. Поле
+# хэша — готовое имя ряда в формате Prometheus, значение — сумма.
+
+METRICS_KEY = 'metrics:counters'
+
+logger = logging.getLogger(__name__)
+
+
+def _redis():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@lru_cache(maxsize=4096)
+def _series_name(name, labels):
+    pairs = ','.join(f'{key}="{_label(value)}"' for key, value in labels)
+    return f'{name}{{{pairs}}}'
+
+
+def _series(name, labels):
+    # имена рядов повторяются от запроса к запросу, строка собирается один раз
+    return _series_name(name, tuple(sorted(labels.items())))
+
+
+SERIES_RE = re.compile(r'^(\w+)\{(.*)\}$')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_series(series):
+    """Обратно к (имя, метки) из имени ряда."""
+    name, labels = SERIES_RE.match(series).groups()
+    return name, {key: re.sub(r'\\(.)', r'\1', value) for key, value in LABEL_RE.findall(labels)}
+
+
+class MetricCounters:
+    def __init__(self, key=METRICS_KEY):
+        self.key = key
+        self.lock = threading.Lock()
+        self.pending = defaultdict(float)
+        # без Redis счетчики остаются только в этом процессе
+        self.local = defaultdict(float)
+        self.flushed_at = time.monotonic()
+
+    def add(self, name, labels, value=1):
+        self.add_many([(name, labels, value)])
+
+    def add_many(self, samples):
+        series = [(_series(name, labels), value) for name, labels, value in samples]
+        with self.lock:
+            for name, value in series:
+                self.pending[name] += value
+            due = time.monotonic() - self.flushed_at >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(float)
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return
+        redis = _redis()
+        if redis is None:
+            with self.lock:
+                for series, value in pending.items():
+                    self.local[series] += value
+            return
+        pipe = redis.pipeline(transaction=False)
+        for series, value in pending.items():
+            pipe.hincrbyfloat(self.key, series, value)
+        try:
+            pipe.execute()
+        except Exception:
+            # сбой Redis не должен ронять запрос: приращения возвращаются
+            # в очередь и уходят со следующим сбросом
+            logger.warning('Не удалось сбросить метрики в Redis', exc_info=True)
+            with self.lock:
+                for series, value in pending.items():
+                    self.pending[series] += value
+
+    def snapshot(self):
+        self.flush()
+        redis = _redis()
+        if redis is None:
+            with self.lock:
+                return dict(self.local)
+        return {series.decode(): float(value) for series, value in redis.hgetall(self.key).items()}
+
+
+counters = MetricCounters()
+
+
+def render_metrics(values):
+    """Текстовый формат Prometheus, ряды сгруппированы по имени метрики."""
+    lines = []
+    metric = None
+    for series in sorted(values):
+        name = series.split('{', 1)[0]
+        if name != metric:
+            metric = name
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{series} {values[series]!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    # скрейпер приходит с токеном, человек — с сессией персонала
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scraper = bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+    if not (scraper or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(counters.snapshot()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class RequestStats:
+    """SQL-запросы и время запроса; вызывается как обертка execute_wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.serialize = 0.0
+        self.depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+# метрики текущего запроса для кода, у которого нет request (сериализаторы)
+current_stats = ContextVar('request_metrics', default=None)
+
+
+@contextmanager
+def serializing():
+    """
+    Время сериализации ответа для метрик запроса, без запросов в базу внутри
+    нее. Вложенные вызовы (вложенные сериализаторы) считаются один раз.
+    """
+    stats = current_stats.get()
+    if stats is None or stats.depth:
+        yield
+        return
+    stats.depth += 1
+    started, db = time.perf_counter(), stats.db
+    try:
+        yield
+    finally:
+        stats.depth -= 1
+        stats.serialize += max(time.perf_counter() - started - (stats.db - db), 0)
+
+
+def show_timing(request):
+    # заголовок раскрывает число запросов и время базы
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user is not None and user.is_staff)
+
+
+class RequestMetricsMiddleware:
+    """
+    Для каждого запроса считает SQL-запросы, время в базе, время
+    сериализации и рендера ответа DRF и размер ответа; отдает их заголовком
+    Server-Timing (персоналу и в DEBUG) и копит счетчики по маршрутам для /metrics. Запросы потоковых ответов, сделанные
+    уже во время отдачи тела, не учитываются. Работает и под ASGI, не
+    переключая асинхронные запросы в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.metrics = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.record(request, response, stats, time.perf_counter() - started, show_timing(request))
+
+    async def __acall__(self, request):
+        stats = request.metrics = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        # асинхронный ORM ходит в базу из потока sync_to_async (под ASGI — один
+        # на запрос), у соединения этого потока обертку и ставим
+        wrapper = await sync_to_async(self.wrap)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.__exit__)(None, None, None)
+            current_stats.reset(token)
+        # request.user ленивый и ходит в базу за сессией
+        show = await sync_to_async(show_timing)(request)
+        return self.record(request, response, stats, time.perf_counter() - started, show)
+
+    @staticmethod
+    def wrap(stats):
+        wrapper = connection.execute_wrapper(stats)
+        wrapper.__enter__()
+        return wrapper
+
+    def record(self, request, response, stats, total, show=False):
+        app = max(total - stats.db - stats.serialize - stats.render, 0)
+        if show:
+            response['Server-Timing'] = (
+                f'db;dur={stats.db * 1000:.1f};desc="{stats.queries} queries", '
+                f'serialize;dur={stats.serialize * 1000:.1f}, render;dur={stats.render * 1000:.1f}, '
+                f'app;dur={app * 1000:.1f}, total;dur={total * 1000:.1f}'
+            )
+
+        match = request.resolver_match
+        # у несовпавших адресов своя метка, иначе число рядов растет без предела
+        labels = {'route': match.route if match else 'unmatched', 'method': request.method}
+        size = 0 if response.streaming else len(response.content)
+        counters.add_many([
+            ('http_requests_total', {**labels, 'status': response.status_code}, 1),
+            ('http_request_duration_seconds_total', labels, total),
+            ('http_db_queries_total', labels, stats.queries),
+            ('http_db_duration_seconds_total', labels, stats.db),
+            ('http_serialize_duration_seconds_total', labels, stats.serialize),
+            ('http_render_duration_seconds_total', labels, stats.render),
+            ('http_response_bytes_total', labels, size),
+        ])
+        return response
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer, который добавляет время рендера к метрикам запроса."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        content = super().render(data, accepted_media_type, renderer_context)
+        request = (renderer_context or {}).get('request')
+        stats = getattr(getattr(request, '_request', None), 'metrics', None)
+        if stats is not None:
+            stats.render += time.perf_counter() - started
+        return content
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='feed_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 11:26
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_attributes(apps, schema_editor):
+    # копия строк ProductParameter; индекс строится после заполнения
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    last_id = 0
+    while True:
+        ids = list(ProductInfo.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        attributes = {offer_id: {} for offer_id in ids}
+        rows = ProductParameter.objects.filter(product_info_id__in=ids).values_list(
+            'product_info_id', 'parameter__name', 'value',
+        )
+        for offer_id, name, value in rows:
+            attributes[offer_id][name] = value
+        ProductInfo.objects.bulk_update(
+            [ProductInfo(id=offer_id, attributes=values) for offer_id, values in attributes.items() if values],
+            ['attributes'],
+        )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='attributes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(fill_attributes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['attributes'], name='productinfo_attributes_idx', opclasses=['jsonb_path_ops']),
+        ),
+    ]
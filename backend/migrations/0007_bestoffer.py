@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 11:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_best_offers(apps, schema_editor):
+    # то же, что backend.offers.best_offers, на моделях этой миграции
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    BestOffer = apps.get_model('backend', 'BestOffer')
+    last_id = 0
+    while True:
+        ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        best = {product_id: BestOffer(product_id=product_id) for product_id in ids}
+        rows = ProductInfo.objects.filter(product_id__in=ids, quantity__gt=0).order_by('price', 'id').values_list(
+            'id', 'product_id', 'shop_id', 'price', 'quantity',
+        )
+        for offer_id, product_id, shop_id, price, quantity in rows:
+            row = best[product_id]
+            if row.offer_id is None:
+                row.offer_id, row.shop_id, row.min_price = offer_id, shop_id, price
+            row.total_quantity += quantity
+        BestOffer.objects.bulk_create(best.values())
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_productinfo_attributes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestOffer',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='best_offer', serialize=False, to='backend.product')),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('total_quantity', models.PositiveIntegerField(default=0)),
+                ('offer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.productinfo')),
+                ('shop', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.shop')),
+            ],
+            options={
+                'verbose_name': 'Лучшее предложение',
+                'verbose_name_plural': 'Лучшие предложения',
+                'indexes': [models.Index(condition=models.Q(('min_price__isnull', False)), fields=['min_price', 'product'], name='bestoffer_price_idx')],
+            },
+        ),
+        migrations.RunPython(fill_best_offers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_bestoffer'),
+    ]
+
+    # на существующей базе сначала выполните manage.py dedupe_catalog
+    operations = [
+        migrations.AddConstraint(
+            model_name='shop',
+            constraint=models.UniqueConstraint(fields=('name',), name='unique_shop_name'),
+        ),
+    ]
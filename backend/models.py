@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from easy_thumbnails.fields import ThumbnailerImageField
 
 STATUS_ORDERS = [
@@ -12,6 +14,13 @@ STATUS_ORDERS = [
     ('confirmed', 'Подтвержден'),
 ]
 
+IMPORT_STATUSES = [
+    ('pending', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+]
+
 CONTACT_INFO = [
     ('phone', 'Телефон'),
     ('email', 'Email'),
@@ -53,6 +62,8 @@ class User(AbstractUser):
 class Shop(models.Model):
     name = models.CharField(max_length=50)
     url = models.URLField(max_length=200)
+    # sha256 последнего импортированного прайс-листа
+    feed_hash = models.CharField(max_length=64, blank=True)
 
     def __str__(self):
         return self.name
@@ -60,6 +71,10 @@ class Shop(models.Model):
     class Meta:
         verbose_name = "Магазин"
         verbose_name_plural = "Магазины"
+        constraints = [
+            # параллельные импорты одного магазина находят одну строку, а не создают две
+            models.UniqueConstraint(fields=['name'], name='unique_shop_name'),
+        ]
 
 class Category(models.Model):
     shops = models.ManyToManyField(Shop, help_text="Выберите магазин")
@@ -71,6 +86,19 @@ class Category(models.Model):
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
+        constraints = [
+            models.UniqueConstraint(fields=['name'], name='unique_category_name'),
+        ]
+
+# язык полнотекстового поиска товаров; поменяли — пересоздайте индекс product_search_idx
+SEARCH_CONFIG = 'russian'
+
+def product_search_vector(prefix=''):
+    # индекс и запросы поиска (backend/search.py) должны строить одно и то же выражение
+    return (
+        SearchVector(f'{prefix}name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(f'{prefix}description', weight='B', config=SEARCH_CONFIG)
+    )
 
 class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
@@ -92,6 +120,14 @@ class Product(models.Model):
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        constraints = [
+            models.UniqueConstraint(fields=['name'], name='unique_product_name'),
+        ]
+        indexes = [
+            GinIndex(product_search_vector(), name='product_search_idx'),
+            # поиск с опечатками, расширение pg_trgm ставит миграция 0005 (TrigramExtension)
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
 class ProductInfo(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='product_infos')
@@ -100,6 +136,9 @@ class ProductInfo(models.Model):
     quantity = models.PositiveIntegerField(default=0)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     price_rrc = models.DecimalField(max_digits=10, decimal_places=2)
+    # {название параметра: значение} — копия строк ProductParameter для фильтра одним условием @>,
+    # обновляется импортом и сигналами ProductParameter (backend/attributes.py)
+    attributes = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.name} {self.shop.name}"
@@ -107,6 +146,36 @@ class ProductInfo(models.Model):
     class Meta:
         verbose_name = "Информация о товаре"
         verbose_name_plural = "Информация о товарах"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shop'], name='unique_product_shop'),
+        ]
+        indexes = [
+            # фильтр поиска по диапазону цен
+            models.Index(fields=['price'], name='productinfo_price_idx'),
+            GinIndex(fields=['attributes'], name='productinfo_attributes_idx', opclasses=['jsonb_path_ops']),
+        ]
+
+class BestOffer(models.Model):
+    """
+    Самое дешевое предложение товара в наличии и общий остаток по магазинам.
+    Пересчитывается по товарам при импорте, заказе и правке предложений
+    (backend/offers.py); min_price пуст, если товара нет в наличии.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='best_offer')
+    offer = models.ForeignKey(ProductInfo, on_delete=models.SET_NULL, null=True, related_name='+')
+    shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, null=True, related_name='+')
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    total_quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Лучшее предложение"
+        verbose_name_plural = "Лучшие предложения"
+        indexes = [
+            # страницы каталога по цене — один проход по индексу
+            models.Index(
+                fields=['min_price', 'product'], name='bestoffer_price_idx', condition=models.Q(min_price__isnull=False),
+            ),
+        ]
 
 class Parameter(models.Model):
     name = models.CharField(max_length=50)
@@ -117,6 +186,9 @@ class Parameter(models.Model):
     class Meta:
         verbose_name = "Параметр"
         verbose_name_plural = "Параметры"
+        constraints = [
+            models.UniqueConstraint(fields=['name'], name='unique_parameter_name'),
+        ]
 
 class ProductParameter(models.Model):
     product_info = models.ForeignKey(ProductInfo, on_delete=models.CASCADE, related_name='parameters')
@@ -126,6 +198,15 @@ class ProductParameter(models.Model):
     def __str__(self):
         return f"{self.parameter.name}: {self.value}"
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
+        ]
+        indexes = [
+            # фильтр поиска «параметр = значение»
+            models.Index(fields=['parameter', 'value'], name='productparameter_value_idx'),
+        ]
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     status = models.CharField(max_length=20, choices=STATUS_ORDERS, default='new')
@@ -139,6 +220,10 @@ class Order(models.Model):
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        indexes = [
+            # список заказов пользователя, новые сначала
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -165,7 +250,42 @@ class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='unique_user_cart'),
+        ]
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product_info = models.ForeignKey(ProductInfo, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField(default=1)
\ No newline at end of file
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product_info'], name='unique_cart_item'),
+        ]
+
+class ImportJob(models.Model):
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    status = models.CharField(max_length=20, choices=IMPORT_STATUSES, default='pending')
+    payload = models.FileField(upload_to='imports/', blank=True)
+    shop = models.CharField(max_length=50, blank=True)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    rows_per_sec = models.FloatField(default=0)
+    stats = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Import #{self.id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    class Meta:
+        verbose_name = "Импорт прайс-листа"
+        verbose_name_plural = "Импорты прайс-листов"
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import BestOffer, ProductInfo
+from .serializers import ProductListQuerySerializer
+
+
+def best_offers(product_ids):
+    """BestOffer для товаров по их предложениям, без записи в базу."""
+    best = {product_id: BestOffer(product_id=product_id) for product_id in product_ids}
+    rows = ProductInfo.objects.filter(product_id__in=product_ids, quantity__gt=0).order_by('price', 'id').values_list(
+        'id', 'product_id', 'shop_id', 'price', 'quantity',
+    )
+    for offer_id, product_id, shop_id, price, quantity in rows:
+        row = best[product_id]
+        if row.offer_id is None:
+            row.offer_id, row.shop_id, row.min_price = offer_id, shop_id, price
+        row.total_quantity += quantity
+    return best.values()
+
+
+def refresh_best_offers(product_ids, batch_size=1000):
+    """Пересчитывает лучшие предложения товаров."""
+    product_ids = sorted(set(product_ids))
+    for i in range(0, len(product_ids), batch_size):
+        chunk = product_ids[i:i + batch_size]
+        # внутри транзакции импорта — без лишней точки сохранения
+        with transaction.atomic(savepoint=False):
+            # параллельные пересчеты одних товаров идут по очереди, последний читает уже все изменения
+            list(BestOffer.objects.select_for_update().filter(product_id__in=chunk).order_by('product_id').values_list('pk'))
+            BestOffer.objects.bulk_create(
+                best_offers(chunk),
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['offer', 'shop', 'min_price', 'total_quantity'],
+            )
+
+
+def schedule_best_offers(product_ids):
+    # после коммита: транзакция заказа не держит лишних блокировок
+    product_ids = set(product_ids)
+    if product_ids:
+        transaction.on_commit(lambda: refresh_best_offers(product_ids))
+
+
+PRODUCT_ORDERINGS = {
+    'price': ('min_price', 'id'),
+    '-price': ('-min_price', '-id'),
+}
+
+
+def best_offer_products(products, query_params):
+    """
+    Фильтры и сортировка списка товаров по лучшему предложению: ?in_stock=1,
+    ?price_min=, ?price_max=, ?ordering=price|-price (только товары в наличии).
+    Возвращает queryset и порядок для курсорной пагинации (None — по умолчанию).
+    """
+    query = ProductListQuerySerializer(data=query_params)
+    query.is_valid(raise_exception=True)
+    data = query.validated_data
+    ordering = PRODUCT_ORDERINGS.get(data['ordering'])
+    if ordering or data['in_stock']:
+        products = products.filter(best_offer__min_price__isnull=False)
+    if data.get('price_min') is not None:
+        products = products.filter(best_offer__min_price__gte=data['price_min'])
+    if data.get('price_max') is not None:
+        products = products.filter(best_offer__min_price__lte=data['price_max'])
+    if ordering:
+        # курсор берет позицию из атрибута объекта, поэтому цена — аннотация
+        products = products.annotate(min_price=F('best_offer__min_price'))
+    return products, ordering
@@ -0,0 +1,19 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+# Курсорная (keyset) пагинация: страница ищется по индексу, а не через OFFSET,
+# поэтому дальние страницы стоят столько же, сколько первая
+
+class CatalogCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class OrderCursorPagination(CursorPagination):
+    ordering = ('-created_at', '-id')
+    page_size = getattr(settings, 'API_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
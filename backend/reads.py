@@ -0,0 +1,171 @@
+from collections import defaultdict
+
+from django.db.models import Prefetch
+
+from .metrics import serializing
+from .models import Cart, CartItem, Category, Order, OrderItem, Product, ProductInfo
+from .serializers import (
+    CartItemSerializer,
+    CategorySerializer,
+    OrderItemDetailSerializer,
+    OrderSerializer,
+    ProductInfoSerializer,
+    ProductSerializer,
+)
+
+
+# Запросы корзины и заказов сразу подгружают весь граф объектов,
+# число запросов не зависит от числа позиций
+def carts_with_items():
+    return Cart.objects.prefetch_related(
+        Prefetch(
+            'items',
+            queryset=CartItem.objects.select_related('product_info__product__category', 'product_info__shop')
+            .prefetch_related('product_info__product__category__shops').order_by('id'),
+        ),
+    )
+
+
+def orders_with_items():
+    return Order.objects.select_related('user').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product__shop').order_by('id')),
+    )
+
+
+# Плоское чтение: строки из values() собираются в те же словари, что отдают
+# сериализаторы выше, без моделей и ModelSerializer на каждую строку. Значения
+# приводятся теми же полями сериализаторов, поэтому JSON совпадает байт в байт.
+
+def _converters(serializer_class, context=None):
+    fields = serializer_class(context=context).fields
+    converters = {}
+    for name, field in fields.items():
+        def convert(value, to_representation=field.to_representation):
+            return None if value is None else to_representation(value)
+        converters[name] = convert
+    return converters
+
+
+def _image(converters, name):
+    # ImageField сериализатора ждет файл, а values() отдает имя
+    if not name:
+        return None
+    field = Product._meta.get_field('image')
+    return converters['image'](field.attr_class(None, field, name))
+
+
+def _category_shops(category_ids):
+    shops = defaultdict(list)
+    rows = Category.shops.through.objects.filter(category_id__in=category_ids).order_by('id')
+    for category_id, shop_id in rows.values_list('category_id', 'shop_id'):
+        shops[category_id].append(shop_id)
+    return shops
+
+
+@serializing()
+def product_info_data(ids, context=None):
+    """Представления предложений по id, как у ProductInfoSerializer."""
+    rows = ProductInfo.objects.filter(id__in=ids).values(
+        'id', 'name', 'quantity', 'price', 'shop__name',
+        'product_id', 'product__name', 'product__description', 'product__price',
+        'product__created_at', 'product__updated_at', 'product__image',
+        'product__category_id', 'product__category__name',
+    )
+    rows = list(rows)
+    shops = _category_shops({row['product__category_id'] for row in rows})
+    offer = _converters(ProductInfoSerializer, context)
+    product = _converters(ProductSerializer, context)
+    category = _converters(CategorySerializer, context)
+
+    data = {}
+    for row in rows:
+        data[row['id']] = {
+            'id': row['id'],
+            'product': {
+                'id': row['product_id'],
+                'category': {
+                    'id': row['product__category_id'],
+                    'name': category['name'](row['product__category__name']),
+                    'shops': shops[row['product__category_id']],
+                },
+                'name': product['name'](row['product__name']),
+                'description': product['description'](row['product__description']),
+                'price': product['price'](row['product__price']),
+                'created_at': product['created_at'](row['product__created_at']),
+                'updated_at': product['updated_at'](row['product__updated_at']),
+                'image': _image(product, row['product__image']),
+            },
+            'shop_name': offer['shop_name'](row['shop__name']),
+            'name': offer['name'](row['name']),
+            'quantity': offer['quantity'](row['quantity']),
+            'price': offer['price'](row['price']),
+        }
+    return data
+
+
+def cart_items(cart_id):
+    """Позиции корзины без данных предложений, для cart_data."""
+    return list(CartItem.objects.filter(cart_id=cart_id).order_by('id').values('id', 'product_info_id', 'quantity'))
+
+
+@serializing()
+def cart_data(cart_id, items, context=None):
+    """Корзина из cart_items() в виде CartSerializer(cart).data."""
+    offers = product_info_data([item['product_info_id'] for item in items], context)
+    quantity = _converters(CartItemSerializer, context)['quantity']
+    return {
+        'id': cart_id,
+        'items': [
+            {'id': item['id'], 'product_info': offers[item['product_info_id']], 'quantity': quantity(item['quantity'])}
+            # позиция из кэша могла пережить удаленное предложение
+            for item in items if item['product_info_id'] in offers
+        ],
+    }
+
+
+ORDER_VALUES = ('id', 'user__username', 'status', 'address', 'is_confirmed', 'created_at')
+
+
+def order_rows(queryset):
+    """values() заказов для orders_data, годится для пагинации."""
+    return queryset.prefetch_related(None).values(*ORDER_VALUES)
+
+
+@serializing()
+def orders_data(rows, context=None):
+    """Заказы из order_rows() в виде OrderSerializer(many=True).data."""
+    items = defaultdict(list)
+    item_rows = OrderItem.objects.filter(order_id__in=[row['id'] for row in rows]).order_by('id').values(
+        'id', 'order_id', 'quantity', 'product_id', 'product__name', 'product__price', 'product__shop__name',
+    )
+    order = _converters(OrderSerializer, context)
+    item = _converters(OrderItemDetailSerializer, context)
+    product = _converters(ProductSerializer, context)
+    for row in item_rows:
+        items[row['order_id']].append({
+            'id': row['id'],
+            # ProductSerializer здесь получает предложение: отдаются общие с товаром поля,
+            # отсутствующие у предложения nullable-поля приходят как null
+            'product': {
+                'id': row['product_id'],
+                'name': product['name'](row['product__name']),
+                'description': None,
+                'price': product['price'](row['product__price']),
+                'image': None,
+            },
+            'shop_name': item['shop_name'](row['product__shop__name']),
+            'quantity': item['quantity'](row['quantity']),
+        })
+
+    return [
+        {
+            'id': row['id'],
+            'user': order['user'](row['user__username']),
+            'status': order['status'](row['status']),
+            'address': order['address'](row['address']),
+            'items': items[row['id']],
+            'is_confirmed': order['is_confirmed'](row['is_confirmed']),
+            'created_at': order['created_at'](row['created_at']),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,76 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import counters
+
+# Кэш по владельцу вместо табличной инвалидации cachalot: данные лежат под
+# ключом пространства (корзины, заказы, предложения) и владельца
+# (пользователь, магазин). У каждого владельца свое поколение ключей — запись
+# сбрасывает поколение только у затронутых владельцев, кэш остальных живет.
+# cachalot остается только для редко меняющихся таблиц каталога
+# (CACHALOT_ONLY_CACHABLE_TABLES).
+
+SCOPED_CACHE_TTL = 60 * 10
+
+
+def enabled(namespace):
+    """Пространство можно выключить настройкой SCOPED_CACHE_DISABLED = ['orders', ...]."""
+    return namespace not in getattr(settings, 'SCOPED_CACHE_DISABLED', ())
+
+
+def _generation_key(namespace, scope):
+    return f'scoped:{namespace}:{scope}'
+
+
+def _prefix(namespace, scope):
+    key = _generation_key(namespace, scope)
+    generation = cache.get(key)
+    if generation is None:
+        # случайное поколение: после сброса или истечения старые ключи недостижимы
+        cache.add(key, uuid.uuid4().hex[:12], _ttl())
+        generation = cache.get(key)
+    return f'{key}:{generation}'
+
+
+def _ttl():
+    return getattr(settings, 'SCOPED_CACHE_TTL', SCOPED_CACHE_TTL)
+
+
+def cached(namespace, scope, suffix, build):
+    """
+    Значение build() под ключом владельца scope в пространстве namespace.
+    Поколение читается до build(): запись, закоммиченная во время сборки,
+    сбросит его, и собранное значение следующим чтениям уже не попадется.
+    """
+    if scope is None or not enabled(namespace):
+        return build()
+    key = f'{_prefix(namespace, scope)}:{suffix}'
+    value = cache.get(key)
+    counters.add('scoped_cache_requests_total', {
+        'namespace': namespace, 'result': 'miss' if value is None else 'hit',
+    })
+    if value is None:
+        value = build()
+        cache.set(key, value, _ttl())
+    return value
+
+
+def request_key(request):
+    # в ответе абсолютные ссылки на страницы, поэтому адрес берется целиком
+    return hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+
+
+def evict(namespace, *scopes):
+    """Сбрасывает кэш владельцев scopes после коммита текущей транзакции."""
+    keys = {_generation_key(namespace, scope) for scope in scopes if scope is not None}
+    if not keys or not enabled(namespace):
+        return
+
+    def run():
+        cache.delete_many(list(keys))
+        counters.add('scoped_cache_evictions_total', {'namespace': namespace}, len(keys))
+    transaction.on_commit(run)
@@ -0,0 +1,101 @@
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import CharField, Count, F, Value
+from django.db.models.functions import Cast
+
+from .attributes import filter_by_attributes
+from .catalog import catalog_offers
+from .models import SEARCH_CONFIG, Product, ProductInfo, product_search_vector
+
+# Поиск предложений: текст ищется по названию и описанию товара через
+# выражение, под которое построен GIN-индекс product_search_idx; если
+# совпадений нет, повторяем по триграммам названия (опечатки). Фасеты —
+# один запрос UNION ALL из нескольких группировок по отфильтрованной выборке.
+
+
+def filter_offers(categories=(), shops=(), price_min=None, price_max=None, params=()):
+    """Предложения с фильтрами поиска; params — пары (название параметра, значение)."""
+    offers = ProductInfo.objects.all()
+    if categories:
+        offers = offers.filter(product__category_id__in=categories)
+    if shops:
+        offers = offers.filter(shop_id__in=shops)
+    if price_min is not None:
+        offers = offers.filter(price__gte=price_min)
+    if price_max is not None:
+        offers = offers.filter(price__lte=price_max)
+    return filter_by_attributes(offers, params)
+
+
+def text_query(q):
+    return SearchQuery(q, config=SEARCH_CONFIG, search_type='websearch')
+
+
+def match_text(offers, q):
+    products = Product.objects.annotate(search=product_search_vector()).filter(search=text_query(q))
+    return offers.filter(product__in=products.values('id'))
+
+
+def match_fuzzy(offers, q):
+    return offers.filter(product__in=Product.objects.filter(name__trigram_word_similar=q).values('id'))
+
+
+def facet_counts(offers):
+    """Число предложений по категориям, магазинам и значениям параметров одним запросом."""
+    offers = offers.order_by()
+    parts = [
+        offers.values(
+            facet=Value('category'), key=Cast('product__category_id', CharField()), label=F('product__category__name'),
+        ),
+        offers.values(facet=Value('shop'), key=Cast('shop_id', CharField()), label=F('shop__name')),
+        offers.filter(parameters__isnull=False).values(
+            facet=Value('parameter'), key=F('parameters__parameter__name'), label=F('parameters__value'),
+        ),
+    ]
+    parts = [part.annotate(count=Count('id')) for part in parts]
+    facets = {'category': [], 'shop': [], 'parameters': defaultdict(list)}
+    for row in parts[0].union(*parts[1:], all=True):
+        if row['facet'] == 'parameter':
+            facets['parameters'][row['key']].append({'value': row['label'], 'count': row['count']})
+        else:
+            facets[row['facet']].append({'id': int(row['key']), 'name': row['label'], 'count': row['count']})
+    for items in [facets['category'], facets['shop'], *facets['parameters'].values()]:
+        items.sort(key=lambda item: -item['count'])
+    facets['parameters'] = dict(facets['parameters'])
+    return facets
+
+
+def search_offers(q='', ordering='', limit=20, offset=0, **filters):
+    """
+    Страница найденных предложений (queryset каталога с подгрузкой для
+    сериализатора), общее число, фасеты и признак нечеткого поиска.
+    """
+    offers = filter_offers(**filters)
+    fuzzy = False
+    if q:
+        matched = match_text(offers, q)
+        facets = facet_counts(matched)
+        if not facets['category']:
+            matched = match_fuzzy(offers, q)
+            facets = facet_counts(matched)
+            fuzzy = True
+        offers = matched
+    else:
+        facets = facet_counts(offers)
+
+    page = catalog_offers().filter(id__in=offers.values('id'))
+    if ordering in ('price', '-price'):
+        page = page.order_by(ordering, 'id')
+    elif q and fuzzy:
+        page = page.annotate(rank=TrigramWordSimilarity(q, 'product__name')).order_by('-rank', 'id')
+    elif q:
+        page = page.annotate(rank=SearchRank(product_search_vector('product__'), text_query(q))).order_by('-rank', 'id')
+    else:
+        page = page.order_by('id')
+    return {
+        'count': sum(item['count'] for item in facets['category']),
+        'fuzzy': fuzzy,
+        'facets': facets,
+        'results': page[offset:offset + limit],
+    }
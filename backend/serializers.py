@@ -8,20 +8,31 @@ from .models import (
     Cart,
     CartItem,
     ProductInfo,
+    ProductParameter,
     Order,
-    OrderItem
+    OrderItem,
+    ImportJob
 )
+from .metrics import serializing
+
+
+class TimedSerializerMixin:
+    """Время представления объектов попадает в метрики запроса (serialize в Server-Timing)."""
+
+    def to_representation(self, instance):
+        with serializing():
+            return super().to_representation(instance)
 
 
 # сериализаторы для отображения и работы с данными
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
 
     class Meta:
@@ -29,13 +40,14 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Shop
-        fields = '__all__'
+        # отпечаток последнего прайс-листа — служебное поле импорта
+        exclude = ['feed_hash']
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     shop_name = serializers.CharField(source='shop.name', read_only=True)
 
@@ -44,7 +56,23 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'shop_name', 'name', 'quantity', 'price']
 
 
-class ContactSerializer(serializers.ModelSerializer):
+class ProductParameterSerializer(serializers.ModelSerializer):
+    parameter = serializers.CharField(source='parameter.name', read_only=True)
+
+    class Meta:
+        model = ProductParameter
+        fields = ['parameter', 'value']
+
+
+# предложение магазина вместе с характеристиками товара
+class ProductInfoDetailSerializer(ProductInfoSerializer):
+    parameters = ProductParameterSerializer(many=True, read_only=True)
+
+    class Meta(ProductInfoSerializer.Meta):
+        fields = ProductInfoSerializer.Meta.fields + ['price_rrc', 'parameters']
+
+
+class ContactSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = ['id', 'type', 'value']
@@ -54,7 +82,7 @@ class ContactSerializer(serializers.ModelSerializer):
 # СЕРИАЛИЗАТОРЫ ДЛЯ ЗАКАЗОВ
 
 # для отображения элементов заказа с полной информацией о товаре и магазине
-class OrderItemDetailSerializer(serializers.ModelSerializer):
+class OrderItemDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     shop_name = serializers.CharField(source='product.shop.name', read_only=True)
 
@@ -64,7 +92,7 @@ class OrderItemDetailSerializer(serializers.ModelSerializer):
 
 
 # основной сериализатор заказа (для чтения)
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = OrderItemDetailSerializer(many=True, read_only=True)
     user = serializers.StringRelatedField()
 
@@ -73,6 +101,28 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'status', 'address', 'items', 'is_confirmed', 'created_at']
 
 
+# для оформления заказа из предложений магазинов: остатки проверяются и списываются
+class OrderPlaceItemSerializer(serializers.Serializer):
+    product_info_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class OrderPlaceSerializer(serializers.ModelSerializer):
+    products_info = OrderPlaceItemSerializer(many=True, write_only=True, allow_empty=False)
+
+    class Meta:
+        model = Order
+        fields = ['address', 'products_info']
+
+    def create(self, validated_data):
+        from .checkout import place_order
+        lines = [(item['product_info_id'], item['quantity']) for item in validated_data['products_info']]
+        return place_order(validated_data['user'], validated_data.get('address'), lines)
+
+    def to_representation(self, instance):
+        return OrderSerializer(instance, context=self.context).data
+
+
 # для создания заказа с вложенными элементами
 class OrderCreateItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField(write_only=True)
@@ -128,7 +178,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product_info = ProductInfoSerializer()
 
     class Meta:
@@ -136,7 +186,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_info', 'quantity']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True)
 
     class Meta:
@@ -153,4 +203,38 @@ class OrderConfirmSerializer(serializers.ModelSerializer):
 class OrderUpdateStatusSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = ['status', 'is_confirmed']
\ No newline at end of file
+        fields = ['status', 'is_confirmed']
+
+
+class ImportJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'shop', 'processed', 'failed', 'rows_per_sec', 'stats',
+            'error', 'created_at', 'started_at', 'finished_at'
+        ]
+
+
+class ProductSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, allow_blank=True, max_length=200, default='')
+    category = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    shop = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    # ?param=Цвет:черный&param=Память:128
+    param = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    ordering = serializers.ChoiceField(choices=['price', '-price'], required=False, default='')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    offset = serializers.IntegerField(min_value=0, max_value=10000, default=0)
+
+    def validate_param(self, value):
+        if any(':' not in item for item in value):
+            raise serializers.ValidationError('Ожидается название:значение')
+        return [tuple(item.split(':', 1)) for item in value]
+
+
+class ProductListQuerySerializer(serializers.Serializer):
+    in_stock = serializers.BooleanField(required=False, default=False)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    ordering = serializers.ChoiceField(choices=['price', '-price'], required=False, default='')
@@ -1,14 +1,96 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from .models import User, Product
-from .tasks import generate_avatar_thumbnails, generate_product_thumbnails
+from .attributes import refresh_attributes
+from .catalog import bump_catalog_version
+from .importer import forget_feed_hashes
+from .offers import schedule_best_offers
+from .models import (
+    User, Shop, Category, Product, ProductInfo, ProductParameter, Order, OrderItem, Cart, CartItem,
+)
+from .scoped_cache import evict
+from .thumbnails import schedule_thumbnails
 
+# миниатюры ставятся в очередь, только если файл изменился (см. backend/thumbnails.py)
 @receiver(post_save, sender=User)
-def user_avatar_post_save(sender, instance, **kwargs):
-    if instance.avatar:
-        generate_avatar_thumbnails.delay(instance.avatar.path)
+def user_avatar_post_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'avatar' in update_fields:
+        schedule_thumbnails(instance.avatar)
 
 @receiver(post_save, sender=Product)
-def product_image_post_save(sender, instance, **kwargs):
-    if instance.image:
-        generate_product_thumbnails.delay(instance.image.path)
\ No newline at end of file
+def product_image_post_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'image' in update_fields:
+        schedule_thumbnails(instance.image)
+
+# копия параметров в ProductInfo.attributes; импорт пишет ее сам, без сигналов
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_changed(sender, instance, **kwargs):
+    refresh_attributes([instance.product_info_id])
+
+# цена и остаток предложения меняют лучшее предложение товара и расходятся с последним
+# прайс-листом магазина; импорт и заказы обрабатывают это сами
+@receiver([post_save, post_delete], sender=ProductInfo)
+def product_info_changed(sender, instance, **kwargs):
+    schedule_best_offers([instance.product_id])
+    forget_feed_hashes([instance.shop_id])
+
+# любое изменение каталога делает снимки в кэше устаревшими
+@receiver([post_save, post_delete], sender=Shop)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductInfo)
+@receiver([post_save, post_delete], sender=ProductParameter)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+# кэш корзин, заказов и предложений сбрасывается только у владельца записи
+# (backend/scoped_cache.py); bulk-операции и UPDATE по queryset сбрасывают его сами
+@receiver([post_save, post_delete], sender=Cart)
+def cart_changed(sender, instance, **kwargs):
+    evict('cart', instance.user_id)
+
+@receiver([post_save, post_delete], sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    evict('cart', *Cart.objects.filter(id=instance.cart_id).values_list('user_id', flat=True))
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    evict('orders', instance.user_id)
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    evict('orders', *Order.objects.filter(id=instance.order_id).values_list('user_id', flat=True))
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def offer_changed(sender, instance, **kwargs):
+    evict('offers', instance.shop_id)
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def offer_parameter_changed(sender, instance, **kwargs):
+    evict('offers', *ProductInfo.objects.filter(id=instance.product_info_id).values_list('shop_id', flat=True))
+
+@receiver(post_save, sender=Shop)
+def shop_changed(sender, instance, **kwargs):
+    evict('offers', instance.id)
+
+# товар и категория входят в данные предложений всех магазинов, которые их продают
+@receiver(post_save, sender=Product)
+def offer_product_changed(sender, instance, **kwargs):
+    evict('offers', *ProductInfo.objects.filter(product=instance).values_list('shop_id', flat=True).distinct())
+
+@receiver(post_save, sender=Category)
+def offer_category_changed(sender, instance, **kwargs):
+    evict_category_offers([instance.pk])
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def category_shops_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # pre_clear: связи еще на месте, а сброс все равно произойдет после коммита
+    if action == 'pre_clear':
+        evict_category_offers(instance.category_set.values_list('id', flat=True) if reverse else [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        evict_category_offers(pk_set if reverse else [instance.pk])
+
+def evict_category_offers(category_ids):
+    shops = ProductInfo.objects.filter(product__category__in=list(category_ids)).values_list('shop_id', flat=True)
+    evict('offers', *shops.distinct())
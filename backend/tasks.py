@@ -1,12 +1,61 @@
 from celery import shared_task
-from easy_thumbnails.files import get_thumbnailer
+from django.utils import timezone
 
+from .feeds import FeedError
+from .importer import import_stream
+from .models import ImportJob
+
+@shared_task
+def generate_thumbnails(name, target=None):
+    from .thumbnails import generate_thumbnails
+    return generate_thumbnails(name, target)
+
+# Прежние имена задач: сообщения, поставленные в очередь до обновления,
+# должны выполниться. Убрать в следующем релизе.
 @shared_task
 def generate_avatar_thumbnails(image_path):
-    thumbnailer = get_thumbnailer(image_path)
-    thumbnailer.get_thumbnail({'size': (100, 100), 'crop': True})
+    return generate_thumbnails(image_path, 'backend.User.avatar')
 
 @shared_task
 def generate_product_thumbnails(image_path):
-    thumbnailer = get_thumbnailer(image_path)
-    thumbnailer.get_thumbnail({'size': (300, 300), 'crop': True})
\ No newline at end of file
+    return generate_thumbnails(image_path, 'backend.Product.image')
+
+@shared_task
+def run_import_job(job_id):
+    try:
+        job = ImportJob.objects.get(id=job_id)
+    except ImportJob.DoesNotExist:
+        return
+    jobs = ImportJob.objects.filter(id=job_id)
+    jobs.update(status='running', started_at=timezone.now())
+
+    def progress(stats):
+        jobs.update(processed=stats.processed, failed=stats.failed, rows_per_sec=stats.rows_per_sec)
+
+    try:
+        # через API приходят частичные прайс-листы: ничего не обнуляем
+        with job.payload.open('rb') as f:
+            stats = import_stream(f, 'json', on_progress=progress, sweep=False)
+    except FeedError as e:
+        jobs.update(status='failed', error=str(e), finished_at=timezone.now())
+        raise
+    except Exception:
+        # текст внутренней ошибки клиенту не отдаем, трассировку пишет Celery
+        jobs.update(status='failed', error='Внутренняя ошибка импорта', finished_at=timezone.now())
+        raise
+
+    jobs.update(
+        status='done',
+        processed=stats.processed,
+        failed=stats.failed,
+        rows_per_sec=stats.rows_per_sec,
+        stats=stats.as_dict(),
+        finished_at=timezone.now(),
+    )
+    job.payload.delete(save=False)
+    jobs.update(payload='')
+
+@shared_task
+def flush_carts():
+    from .carts import flush_dirty_carts
+    return flush_dirty_carts()
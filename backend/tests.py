@@ -4,12 +4,34 @@ from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from rest_framework import status
 import base64
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from cachalot.api import cachalot_disabled
 
-from .models import Shop, Category, Product, ProductInfo, Contact, Order
+from .models import (
+    Shop, Category, Product, ProductInfo, Contact, Order, ImportJob, Parameter, ProductParameter, Cart, CartItem,
+    OrderItem, BestOffer
+)
+from .offers import refresh_best_offers
+from .catalog import get_catalog_version
+from .feeds import FeedError, read_feed
+from .importer import PriceListImporter, import_feed, import_feeds, collect_feeds
+from .tasks import run_import_job
 
 User = get_user_model()
 
@@ -100,4 +122,1102 @@ class ProductThrottleTest(APITestCase):
             if i < 5:
                 self.assertNotEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
             else:
-                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
\ No newline at end of file
+                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+class PriceListImporterTest(TestCase):
+    def goods(self, count, price=100):
+        return [
+            {'category': 224, 'name': f'Товар {i}', 'model': f'model/{i}', 'price': price, 'quantity': i}
+            for i in range(count)
+        ]
+
+    def test_import_creates_catalog(self):
+        stats = PriceListImporter('Связной', [{'id': 224, 'name': 'Смартфоны'}]).run(self.goods(3))
+
+        self.assertEqual(stats.processed, 3)
+        self.assertEqual(stats.created, 3)
+        self.assertEqual(Category.objects.filter(name='Смартфоны').count(), 1)
+        self.assertEqual(ProductInfo.objects.filter(shop__name='Связной').count(), 3)
+        self.assertEqual(ProductInfo.objects.get(product__name='Товар 2').name, 'model/2')
+
+    def test_reimport_updates_only_changed(self):
+        PriceListImporter('Связной').run(self.goods(3))
+        goods = self.goods(3)
+        goods[0]['price'] = 150
+        stats = PriceListImporter('Связной').run(goods)
+
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (0, 1, 2))
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(ProductInfo.objects.get(product__name='Товар 0').price, 150)
+
+    def test_bad_rows_are_counted(self):
+        goods = self.goods(2) + [
+            {'name': 'Без цены', 'category': 224},
+            # без model название предложения берется из name, а оно длиннее 50 символов
+            {'name': 'Очень длинное название ' * 4, 'category': 224, 'price': 100},
+        ]
+        stats = PriceListImporter('Связной').run(goods)
+
+        self.assertEqual((stats.processed, stats.failed), (4, 2))
+        self.assertFalse(Product.objects.filter(name='Без цены').exists())
+        self.assertEqual(Product.objects.count(), 2)
+
+    # cachalot отвечал бы на часть запросов из кэша, и счет зависел бы от его состояния
+    @cachalot_disabled(all_queries=True)
+    def test_query_count_does_not_grow_with_batch(self):
+        # категория уже есть, обе пачки создают только новые товары и предложения
+        PriceListImporter('Связной').run(self.goods(1))
+        counts = []
+        for shop, size in (('Ситилинк', 5), ('Эльдорадо', 50)):
+            goods = [dict(item, name=f'{shop} {item["name"]}') for item in self.goods(size)]
+            importer = PriceListImporter(shop, batch_size=1000)
+            with CaptureQueriesContext(connection) as queries:
+                importer.import_batch(goods)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_parameters_copied_to_attributes(self):
+        from .attributes import filter_by_attributes
+
+        goods = self.goods(3)
+        goods[0]['parameters'] = {'Цвет': 'черный', 'Память (Гб)': 8}
+        goods[1]['parameters'] = {'Цвет': 'черный', 'Память (Гб)': 16}
+        PriceListImporter('Связной').run(goods)
+        offer = ProductInfo.objects.get(product__name='Товар 0')
+        self.assertEqual(offer.attributes, {'Цвет': 'черный', 'Память (Гб)': '8'})
+        self.assertEqual(ProductParameter.objects.filter(product_info=offer).count(), 2)
+        found = filter_by_attributes(ProductInfo.objects.all(), [('Цвет', 'черный'), ('Память (Гб)', '16')])
+        self.assertEqual([o.product.name for o in found], ['Товар 1'])
+
+        # пропавший из прайса параметр удаляется, без ключа parameters ничего не меняется
+        goods[0]['parameters'] = {'Цвет': 'белый'}
+        del goods[1]['parameters']
+        stats = PriceListImporter('Связной').run(goods)
+        self.assertEqual((stats.updated, stats.unchanged), (1, 2))
+        offer.refresh_from_db()
+        self.assertEqual(offer.attributes, {'Цвет': 'белый'})
+        self.assertEqual(list(offer.parameters.values_list('value', flat=True)), ['белый'])
+        self.assertEqual(ProductInfo.objects.get(product__name='Товар 1').attributes['Цвет'], 'черный')
+
+        # правка параметра вручную обновляет копию через сигнал
+        parameter = offer.parameters.get()
+        parameter.value = 'синий'
+        parameter.save()
+        offer.refresh_from_db()
+        self.assertEqual(offer.attributes, {'Цвет': 'синий'})
+
+
+class FeedReaderTest(TestCase):
+    shop_yaml = os.path.join(os.path.dirname(__file__), 'shop1.yaml')
+
+    def test_yaml_and_json_feeds_match(self):
+        with open(self.shop_yaml, encoding='utf-8') as f:
+            header, goods = read_feed(f)
+            goods = list(goods)
+        self.assertEqual(header['shop'], 'Связной')
+
+        data = dict(header, goods=goods)
+        json_header, json_goods = read_feed(io.StringIO(json.dumps(data, ensure_ascii=False)), 'json')
+        self.assertEqual(json_header, header)
+        self.assertEqual(list(json_goods), goods)
+
+    def test_header_after_goods(self):
+        import yaml
+
+        with open(self.shop_yaml, encoding='utf-8') as f:
+            data = yaml.safe_load(f)
+        # safe_dump сортирует ключи: categories, goods, shop
+        path = os.path.join(tempfile.mkdtemp(), 'sorted.yaml')
+        with open(path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(data, f, allow_unicode=True)
+
+        import_feed(path)
+        self.assertEqual(ProductInfo.objects.filter(shop__name='Связной').count(), 14)
+
+        class Unseekable(io.BytesIO):
+            def seekable(self):
+                return False
+
+        stream = Unseekable(json.dumps({'goods': [{'name': 'Товар'}], 'shop': 'Связной'}).encode())
+        header, goods = read_feed(stream, 'json')
+        with self.assertRaises(FeedError):
+            list(goods)
+
+    def test_import_command_streams_file(self):
+        out = io.StringIO()
+        call_command('import_products', self.shop_yaml, '--batch-size', '5', stdout=out)
+
+        self.assertIn('Импорт завершен', out.getvalue())
+        self.assertEqual(ProductInfo.objects.filter(shop__name='Связной').count(), 14)
+
+
+class IncrementalImportTest(TestCase):
+    def write_feed(self, goods):
+        path = os.path.join(tempfile.mkdtemp(), 'shop.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'shop': 'Связной', 'goods': goods}, f, ensure_ascii=False)
+        return path
+
+    def goods(self, count):
+        return [{'category': 224, 'name': f'Товар {i}', 'price': 100, 'quantity': 5} for i in range(count)]
+
+    def test_unchanged_feed_is_skipped(self):
+        path = self.write_feed(self.goods(10))
+        import_feed(path)
+
+        with self.assertNumQueries(1):
+            stats = import_feed(path)
+        self.assertTrue(stats.skipped)
+
+    def test_stock_sold_since_import_is_restored(self):
+        from .checkout import place_order
+
+        path = self.write_feed(self.goods(2))
+        import_feed(path)
+        user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        offer = ProductInfo.objects.get(product__name='Товар 0')
+        place_order(user, 'Москва', [(offer.id, 3)])
+
+        stats = import_feed(path)
+        self.assertFalse(stats.skipped)
+        offer.refresh_from_db()
+        self.assertEqual(offer.quantity, 5)
+        self.assertTrue(import_feed(path).skipped)
+
+    def test_diff_stats_and_removed_offers(self):
+        import_feed(self.write_feed(self.goods(5)))
+        goods = self.goods(4)
+        goods[0]['quantity'] = 7
+        goods.append({'category': 224, 'name': 'Новый', 'price': 50, 'quantity': 1})
+
+        stats = import_feed(self.write_feed(goods))
+
+        self.assertEqual(
+            (stats.created, stats.updated, stats.unchanged, stats.removed),
+            (1, 1, 3, 1)
+        )
+        self.assertEqual(ProductInfo.objects.get(product__name='Товар 4').quantity, 0)
+
+
+class MultiShopImportTest(TestCase):
+    def test_bad_feed_does_not_affect_other_shops(self):
+        directory = tempfile.mkdtemp()
+        for shop in ('Shop1', 'Shop2'):
+            with open(os.path.join(directory, f'{shop}.json'), 'w', encoding='utf-8') as f:
+                json.dump({'shop': shop, 'goods': [
+                    {'category': 224, 'name': 'Общий товар', 'price': 100, 'quantity': 1},
+                    {'category': 5, 'name': f'Товар {shop}', 'price': 100, 'quantity': 1},
+                ]}, f)
+        with open(os.path.join(directory, 'broken.json'), 'w', encoding='utf-8') as f:
+            f.write('{"shop": "Broken", "goods": [{"name": ')
+
+        results = import_feeds(collect_feeds(directory), workers=1)
+
+        self.assertEqual([result['ok'] for result in results], [True, True, False])
+        self.assertEqual(Product.objects.filter(name='Общий товар').count(), 1)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(ProductInfo.objects.count(), 4)
+        self.assertFalse(ProductInfo.objects.filter(shop__name='Broken').exists())
+
+    def test_bad_header_is_reported_and_next_feeds_run(self):
+        directory = tempfile.mkdtemp()
+        feeds = {
+            'A': {'shop': 'A'},
+            'B': {'shop': 'B', 'categories': [{'name': 'Без id'}]},
+            'C': {'shop': 'C'},
+        }
+        for name, header in feeds.items():
+            with open(os.path.join(directory, f'{name}.json'), 'w', encoding='utf-8') as f:
+                json.dump({**header, 'goods': [{'category': 224, 'name': 'Товар', 'price': 100, 'quantity': 1}]}, f)
+
+        results = import_feeds(collect_feeds(directory), workers=1)
+
+        self.assertEqual([result['ok'] for result in results], [True, False, True])
+        self.assertIn('Некорректная категория', results[1]['error'])
+        self.assertEqual(
+            sorted(ProductInfo.objects.values_list('shop__name', flat=True)), ['A', 'C'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportJobTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='importer', password='testpass', email='importer@test.com')
+        self.client.force_authenticate(self.user)
+
+    def test_import_runs_in_background(self):
+        data = {
+            'shop': 'Связной',
+            'goods': [
+                {'category': 224, 'name': 'Товар 1', 'price': 100, 'quantity': 1},
+                {'category': 224, 'name': 'Без цены'},
+            ],
+        }
+        with mock.patch('backend.views.run_import_job.delay', side_effect=run_import_job) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('import-products'), data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(response.data['job_id'])
+
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual((response.data['processed'], response.data['failed']), (2, 1))
+        self.assertFalse(ImportJob.objects.get().payload)
+        self.assertTrue(ProductInfo.objects.filter(product__name='Товар 1').exists())
+
+    def test_partial_import_keeps_other_offers(self):
+        for name in ('Товар 1', 'Товар 2'):
+            data = {'shop': 'Связной', 'goods': [{'category': 224, 'name': name, 'price': 100, 'quantity': 3}]}
+            with mock.patch('backend.views.run_import_job.delay', side_effect=run_import_job):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(reverse('import-products'), data, format='json')
+
+        self.assertEqual(ProductInfo.objects.get(product__name='Товар 1').quantity, 3)
+        self.assertEqual(ProductInfo.objects.get(product__name='Товар 2').quantity, 3)
+
+    def test_header_after_goods_is_accepted(self):
+        data = {'goods': [{'category': 224, 'name': 'Товар 1', 'price': 100, 'quantity': 1}], 'shop': 'Связной'}
+        with mock.patch('backend.views.run_import_job.delay', side_effect=run_import_job):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('import-products'), data, format='json')
+
+        self.assertEqual(self.client.get(response.data['status_url']).data['status'], 'done')
+        self.assertTrue(ProductInfo.objects.filter(shop__name='Связной').exists())
+
+    def test_import_requires_goods(self):
+        response = self.client.post(reverse('import-products'), {'shop': 'Связной'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_job_is_visible_only_to_its_owner(self):
+        job = ImportJob.objects.create(user=self.user, shop='Связной', status='failed', error='Внутренняя ошибка импорта')
+        url = reverse('import-job-status', args=[job.id])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+        other = User.objects.create_user(username='other', password='testpass', email='other@test.com')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(
+            self.client.post(reverse('import-products'), {'goods': []}, format='json').status_code,
+            status.HTTP_401_UNAUTHORIZED,
+        )
+
+    def test_internal_error_is_not_exposed(self):
+        data = {'shop': 'Связной', 'goods': [{'category': 224, 'name': 'Товар 1', 'price': 100, 'quantity': 1}]}
+        with mock.patch('backend.views.run_import_job.delay'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('import-products'), data, format='json')
+
+        with mock.patch('backend.tasks.import_stream', side_effect=RuntimeError('password=secret')), \
+                self.assertRaises(RuntimeError):
+            run_import_job(response.data['job_id'])
+        self.assertEqual(self.client.get(response.data['status_url']).data['error'], 'Внутренняя ошибка импорта')
+
+
+class CatalogQueryBudgetTest(APITestCase):
+    # сколько запросов может сделать эндпоинт каталога независимо от числа товаров
+    budgets = {
+        'get_products': 2,
+        'product-list': 2,
+        'export-products': 2,
+        'product_info_list': 3,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        self.parameter = Parameter.objects.create(name='Цвет')
+        self.add_products(2)
+
+    def add_products(self, count):
+        for _ in range(count):
+            category = Category.objects.create(name=f'Категория {Category.objects.count()}')
+            category.shops.add(self.shop)
+            product = Product.objects.create(name=f'Товар {Product.objects.count()}', category=category)
+            offer = ProductInfo.objects.create(
+                product=product, shop=self.shop, name=product.name, quantity=1, price=10, price_rrc=10
+            )
+            ProductParameter.objects.create(product_info=offer, parameter=self.parameter, value='черный')
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    # бюджет считает запросы ORM: кэш cachalot внутри транзакции теста cache.clear() не сбрасывает
+    @cachalot_disabled(all_queries=True)
+    def test_catalog_query_count_is_constant(self):
+        for name, budget in self.budgets.items():
+            url = reverse(name)
+            small = self.count_queries(url)
+            self.add_products(5)
+            large = self.count_queries(url)
+
+            self.assertEqual(small, large, name)
+            self.assertLessEqual(large, budget, name)
+
+
+class CursorPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass')
+        category = Category.objects.create(name='Категория')
+        for i in range(5):
+            Product.objects.create(name=f'Товар {i}', category=category)
+            Order.objects.create(user=self.user)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_products_are_paginated_by_id(self):
+        ids = self.walk(reverse('get_products') + '?page_size=2')
+        self.assertEqual(ids, list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_orders_are_paginated_newest_first(self):
+        self.client.force_authenticate(self.user)
+        ids = self.walk(reverse('list_orders') + '?page_size=2')
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+
+class StreamingExportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Категория')
+        for i in range(3):
+            Product.objects.create(name=f'Товар {i}', category=category, price=10)
+
+    def test_ndjson_export(self):
+        response = self.client.get(reverse('export-products'), {'stream': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Товар 0', 'Товар 1', 'Товар 2'])
+        self.assertEqual(rows[0]['category']['name'], 'Категория')
+
+    def test_gzip_csv_export(self):
+        response = self.client.get(reverse('export-products'), {'stream': 'csv'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2]['name'], 'Товар 2')
+        self.assertEqual(rows[2]['category'], 'Категория')
+
+
+class CatalogSnapshotTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        self.category = Category.objects.create(name='Категория')
+        self.product = Product.objects.create(name='Товар', category=self.category)
+        ProductInfo.objects.create(
+            product=self.product, shop=self.shop, name='Товар', quantity=1, price=10, price_rrc=10
+        )
+
+    def test_snapshot_is_served_from_cache(self):
+        url = reverse('catalog_offers')
+        response = self.client.get(url, {'shop': self.shop.id})
+        self.assertEqual([row['shop_name'] for row in response.json()], ['Shop1'])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, {'shop': self.shop.id})
+        self.assertEqual(cached.content, response.content)
+
+        not_modified = self.client.get(url, {'shop': self.shop.id}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_save_bumps_catalog_version(self):
+        url = reverse('catalog_products')
+        etag = self.client.get(url)['ETag']
+        version = get_catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Новое имя'
+            self.product.save()
+
+        self.assertGreater(get_catalog_version(), version)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['name'], 'Новое имя')
+
+
+class ConstraintsTest(TestCase):
+    def test_offer_is_unique_per_shop(self):
+        shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        product = Product.objects.create(name='Товар', category=Category.objects.create(name='Категория'))
+        ProductInfo.objects.create(product=product, shop=shop, name='Товар', price=1, price_rrc=1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductInfo.objects.create(product=product, shop=shop, name='Товар', price=2, price_rrc=2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Category.objects.create(name='Категория')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Shop.objects.create(name='Shop1', url='http://shop1.com')
+
+
+class PlaceOrderTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        self.client.force_authenticate(self.user)
+        self.shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        category = Category.objects.create(name='Категория')
+        self.offers = [
+            ProductInfo.objects.create(
+                product=Product.objects.create(name=f'Товар {i}', category=category),
+                shop=self.shop, name=f'Товар {i}', quantity=5, price=10, price_rrc=10
+            )
+            for i in range(3)
+        ]
+
+    def place(self, lines):
+        return self.client.post(reverse('create_order'), {
+            'address': 'Test Address',
+            'products_info': [{'product_info_id': offer.id, 'quantity': quantity} for offer, quantity in lines],
+        }, format='json')
+
+    def test_order_reserves_stock(self):
+        response = self.place([(self.offers[0], 2), (self.offers[1], 5), (self.offers[0], 1)])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(id=response.data['id'])
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity')),
+            [(self.offers[0].id, 3), (self.offers[1].id, 5)]
+        )
+        self.offers[0].refresh_from_db()
+        self.assertEqual(self.offers[0].quantity, 2)
+
+    def test_oversell_is_rejected_atomically(self):
+        response = self.place([(self.offers[0], 1), (self.offers[1], 6)])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(ProductInfo.objects.get(id=self.offers[0].id).quantity, 5)
+
+    def test_placement_queries_do_not_grow_with_lines(self):
+        from .checkout import place_order
+
+        with CaptureQueriesContext(connection) as one:
+            place_order(self.user, '', [(self.offers[0].id, 1)])
+        with CaptureQueriesContext(connection) as three:
+            place_order(self.user, '', [(offer.id, 1) for offer in self.offers])
+        self.assertEqual(len(one), len(three))
+
+
+class MailQueueTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_registration_enqueues_activation_email(self):
+        with mock.patch('orders.tasks.send_email.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('register'), {
+                    'username': 'newuser', 'email': 'new@test.com', 'password': 'testpass123'
+                })
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        delay.assert_called_once()
+        self.assertEqual(delay.call_args.args[3], ['new@test.com'])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_send_email_task(self):
+        from orders.tasks import send_email
+
+        send_email('Тема', 'Текст', 'from@test.com', ['to@test.com'])
+        self.assertEqual(mail.outbox[0].to, ['to@test.com'])
+
+
+@override_settings(MAIL_BATCH_SIZE=2, EMAIL_HOST_USER='shop@test.com')
+class MailBatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', email='buyer@test.com', password='pass')
+
+    def test_notifications_are_sent_in_batches(self):
+        from orders.tasks import buffer_notification, flush_mail_buffer
+
+        orders = [Order.objects.create(user=self.user, address=f'Адрес {i}') for i in range(3)]
+        with mock.patch('orders.tasks.flush_mail_buffer.apply_async') as schedule:
+            for order in orders:
+                buffer_notification('order_confirmation', order_id=order.id)
+        # сброс планируется один раз на окно
+        schedule.assert_called_once()
+
+        with mock.patch('orders.tasks.send_mail_batch.delay') as send_batch:
+            self.assertEqual(flush_mail_buffer(), 2)
+        self.assertEqual([len(call.args[0]) for call in send_batch.call_args_list], [2, 1])
+
+    def test_batch_uses_one_connection(self):
+        from orders.tasks import send_mail_batch
+
+        order = Order.objects.create(user=self.user, address='Москва')
+        notifications = [
+            {'kind': 'order_confirmation', 'order_id': order.id},
+            {'kind': 'email', 'subject': 'Тема', 'message': 'Текст', 'from_email': 'a@test.com', 'to': ['b@test.com']},
+        ]
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_connection:
+            self.assertEqual(send_mail_batch(notifications), 2)
+        open_connection.assert_called_once()
+        self.assertEqual(mail.outbox[0].to, ['buyer@test.com'])
+        self.assertIn('Москва', mail.outbox[0].alternatives[0][0])
+
+    def test_retry_resends_only_unsent_messages(self):
+        from smtplib import SMTPException
+        from orders.tasks import send_mail_batch
+
+        notifications = [
+            {'kind': 'email', 'subject': 'Тема', 'message': 'Текст', 'from_email': 'a@test.com', 'to': [f'{i}@test.com']}
+            for i in range(3)
+        ]
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=[1, SMTPException('обрыв')]), \
+                mock.patch.object(send_mail_batch, 'retry', return_value=RuntimeError()) as retry:
+            with self.assertRaises(RuntimeError):
+                send_mail_batch(notifications)
+        self.assertEqual(retry.call_args.kwargs['args'], [notifications[1:]])
+
+
+class CartStoreTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        self.client.force_authenticate(self.user)
+        shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        category = Category.objects.create(name='Категория')
+        self.offers = [
+            ProductInfo.objects.create(
+                product=Product.objects.create(name=f'Товар {i}', category=category),
+                shop=shop, name=f'Товар {i}', quantity=5, price=10, price_rrc=10
+            )
+            for i in range(2)
+        ]
+
+    def test_stores_return_same_cart(self):
+        from .carts import RedisCartStore, SqlCartStore
+
+        carts = []
+        for store in (SqlCartStore(self.user.id), RedisCartStore(self.user.id)):
+            self.assertTrue(store.add(self.offers[0].id, 2))
+            self.assertTrue(store.add(self.offers[0].id, 1))
+            self.assertFalse(store.add(0, 1))
+            self.assertFalse(store.add(self.offers[0].id, 0))
+            self.assertFalse(store.add(self.offers[0].id, -5))
+            carts.append(store.data())
+            cache.clear()
+            Cart.objects.all().delete()
+
+        sql, redis = carts
+        self.assertEqual(redis['items'][0]['quantity'], 3)
+        self.assertEqual(
+            [{**item, 'id': None} for item in redis['items']],
+            [{**item, 'id': None} for item in sql['items']]
+        )
+
+    @override_settings(CART_BACKEND='redis')
+    def test_redis_cart_is_flushed_at_checkout(self):
+        with mock.patch('backend.tasks.flush_carts') as schedule:
+            self.client.post(reverse('add_to_cart'), {'product_info_id': self.offers[0].id, 'quantity': 2})
+            self.client.post(reverse('add_to_cart'), {'product_info_id': self.offers[1].id})
+        schedule.apply_async.assert_called_once()
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.put(
+            reverse('update_cart_item', args=[self.offers[1].id]), {'quantity': 0}, format='json')
+        self.assertEqual(response.data, {'message': 'Элемент удален из корзины'})
+
+        response = self.client.post(reverse('create_order'), {
+            'address': 'Test Address',
+            'products_info': [{'product_info_id': self.offers[0].id, 'quantity': 2}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            list(CartItem.objects.values_list('product_info_id', 'quantity')), [(self.offers[0].id, 2)])
+
+    def test_dirty_carts_are_flushed(self):
+        from .carts import RedisCartStore, flush_dirty_carts
+
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product_info=self.offers[1], quantity=4)
+        store = RedisCartStore(self.user.id)
+        with mock.patch('backend.tasks.flush_carts'):
+            # корзина, которой нет в Redis, подтягивается из таблиц
+            store.add(self.offers[0].id, 1)
+            store.remove(self.offers[1].id)
+
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(
+            list(CartItem.objects.values_list('product_info_id', 'quantity')), [(self.offers[0].id, 1)])
+
+    @override_settings(CART_BACKEND='redis')
+    def test_non_positive_quantity_is_rejected(self):
+        response = self.client.post(reverse('add_to_cart'), {'product_info_id': self.offers[0].id, 'quantity': -1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('get_cart')).data['items'], [])
+
+
+class SerializationQueryBudgetTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        self.client.force_authenticate(self.user)
+        self.shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        self.category = Category.objects.create(name='Категория')
+        self.category.shops.add(self.shop)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def add_lines(self, count):
+        # кэш корзины и заказов сбрасывается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                product = Product.objects.create(
+                    name=f'Товар {Product.objects.count()}', category=self.category, price=5,
+                )
+                offer = ProductInfo.objects.create(
+                    product=product, shop=self.shop, name=f'Предложение {i}', quantity=5, price=10, price_rrc=10
+                )
+                CartItem.objects.create(cart=self.cart, product_info=offer, quantity=i + 1)
+                order = Order.objects.create(user=self.user, address='Москва')
+                OrderItem.objects.create(order=order, product=offer, shop=self.shop, quantity=1)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    # иначе cachalot отвечает на часть запросов (backend_category_shops) из кэша
+    @cachalot_disabled(all_queries=True)
+    def test_query_count_does_not_grow(self):
+        for flat in (True, False):
+            for url in (reverse('get_cart'), reverse('list_orders')):
+                cache.clear()
+                with override_settings(API_FLAT_READS=flat):
+                    self.add_lines(1)
+                    few = self.count_queries(url)
+                    self.add_lines(5)
+                    self.assertEqual(self.count_queries(url), few, url)
+
+    def test_flat_reads_match_serializers(self):
+        self.add_lines(3)
+        order = Order.objects.first()
+        for url in (reverse('get_cart'), reverse('list_orders')):
+            flat = self.client.get(url).content
+            with override_settings(API_FLAT_READS=False):
+                self.assertEqual(self.client.get(url).content, flat, url)
+
+        with self.assertNumQueries(2):
+            # заказ с пользователем и позиции с предложениями и магазинами
+            response = self.client.get(reverse('order-details', args=[order.id]))
+        self.assertEqual(len(response.data['items']), 1)
+
+
+class IdempotentWritesTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        self.client.force_authenticate(self.user)
+        shop = Shop.objects.create(name='Shop1', url='http://shop1.com')
+        self.offer = ProductInfo.objects.create(
+            product=Product.objects.create(name='Товар', category=Category.objects.create(name='Категория')),
+            shop=shop, name='Товар', quantity=5, price=10, price_rrc=10
+        )
+
+    def test_retried_order_is_placed_once(self):
+        data = {'address': 'Москва', 'products_info': [{'product_info_id': self.offer.id, 'quantity': 2}]}
+        first = self.client.post(reverse('create_order'), data, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        retry = self.client.post(reverse('create_order'), data, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((retry.status_code, retry.data), (first.status_code, first.data))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductInfo.objects.get(id=self.offer.id).quantity, 3)
+
+        data['address'] = 'Казань'
+        response = self.client.post(reverse('create_order'), data, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_cart_increments_are_atomic(self):
+        url = reverse('add_to_cart')
+        self.client.post(url, {'product_info_id': self.offer.id, 'quantity': 2}, HTTP_IDEMPOTENCY_KEY='one')
+        self.client.post(url, {'product_info_id': self.offer.id, 'quantity': 2}, HTTP_IDEMPOTENCY_KEY='one')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {'product_info_id': self.offer.id, 'quantity': 3})
+
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+        self.assertTrue(any('"quantity" + ' in query['sql'] for query in queries.captured_queries))
+
+    def test_confirm_link_is_applied_once(self):
+        order = Order.objects.create(user=self.user, status='pending_confirmation')
+        url = reverse('confirm_order', args=[base64.urlsafe_b64encode(str(order.id).encode()).decode()])
+
+        with mock.patch('backend.views.queue_order_confirmation') as queue:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 400)
+        queue.assert_called_once_with(order.id)
+        self.assertEqual(Order.objects.get(id=order.id).status, 'confirmed')
+
+
+class ApiBenchmarkTest(TestCase):
+    def test_in_process_run_reports_every_route(self):
+        from .benchmarks.report import save_report
+        from .benchmarks.runner import run_in_process
+        from .benchmarks.seed import seed_catalog
+
+        offer_ids = seed_catalog(shops=2, products=10, offers=2)
+        self.assertEqual(len(offer_ids), 20)
+
+        results, elapsed = run_in_process(offer_ids, users=2, iterations=2, export_every=2)
+        report = results.summary(elapsed, mode='test-client')
+
+        self.assertEqual(
+            set(report['routes']),
+            {'register', 'token', 'cart/add', 'orders/create', 'orders', 'products/list', 'export'}
+        )
+        self.assertEqual(report['orders_placed'], 4)
+        self.assertTrue(all(row['errors'] == 0 for row in report['routes'].values()), report['routes'])
+        self.assertIsNotNone(report['routes']['orders/create']['queries_per_request'])
+
+        path = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        save_report(report, path)
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['orders_placed'], 4)
+
+
+class RequestMetricsTest(APITestCase):
+    def setUp(self):
+        from .metrics import counters
+
+        # счетчики прошлых тестов сбрасываются в кэш и очищаются вместе с ним
+        counters.flush()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='buyer', password='testpass', email='buyer@test.com', is_staff=True,
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_counters(self):
+        response = self.client.get(reverse('get_cart'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertRegex(timing, r'serialize;dur=[\d.]+, render;dur=')
+
+        # /metrics — обычная вьюха Django, персонал входит сессией
+        self.client.force_login(self.user)
+        metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE http_requests_total counter', metrics)
+        self.assertIn('http_requests_total{method="GET",route="api/cart/",status="200"} 1.0', metrics)
+        self.assertIn('http_db_queries_total{method="GET",route="api/cart/"}', metrics)
+
+    def test_flush_failure_keeps_counts(self):
+        from redis.exceptions import ConnectionError
+        from .metrics import MetricCounters
+
+        counters = MetricCounters(key='metrics:test')
+        counters.add('test_total', {'route': 'x'}, 2)
+        with mock.patch('redis.client.Pipeline.execute', side_effect=ConnectionError), \
+                self.assertLogs('backend.metrics', 'WARNING'):
+            counters.flush()
+        counters.add('test_total', {'route': 'x'}, 1)
+        self.assertEqual(counters.snapshot(), {'test_total{route="x"}': 3.0})
+
+    def test_non_staff_gets_no_timing_or_metrics(self):
+        buyer = User.objects.create_user(username='plain', password='testpass', email='plain@test.com')
+        self.client.force_authenticate(buyer)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('get_cart')))
+        self.client.force_login(buyer)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class TaskMetricsTest(TestCase):
+    def setUp(self):
+        from .metrics import counters
+
+        counters.flush()
+        cache.clear()
+
+    def test_task_counters_and_summary(self):
+        import time
+        from orders.celery import ENQUEUED_AT_HEADER, debug_task, task_enqueued
+        from .management.commands.task_stats import task_summary
+        from .metrics import counters
+
+        # в eager-режиме публикации нет, сигнал и заголовок воспроизводим вручную
+        headers = {}
+        task_enqueued(sender=debug_task.name, headers=headers)
+        headers[ENQUEUED_AT_HEADER] = time.time() - 1
+        debug_task.apply(headers=headers)
+
+        row = task_summary(counters.snapshot())[debug_task.name]
+        self.assertEqual((row['published'], row['started'], row['success']), (1, 1, 1))
+        self.assertGreaterEqual(row['wait'], 1)
+        self.assertGreater(row['runtime'], 0)
+
+
+class ThumbnailPipelineTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Фото')
+
+    def _image(self):
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_one_decode_for_all_aliases_and_no_repeat(self):
+        from easy_thumbnails import engine
+
+        with mock.patch.object(engine, 'generate_source_image', wraps=engine.generate_source_image) as decode:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Product.objects.create(category=self.category, name='Камера', image=self._image())
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.media, 'thumbs', 'products'))), 2)
+
+        # сохранение без смены файла и повторная постановка задачи ничего не делают
+        with mock.patch('backend.tasks.generate_thumbnails') as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.name = 'Камера 2'
+                product.save()
+        task.delay.assert_not_called()
+
+    def test_queued_jobs_coalesce(self):
+        with mock.patch('backend.tasks.generate_thumbnails') as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                product = Product.objects.create(category=self.category, name='Камера', image=self._image())
+                product.save()
+                product.save()
+        self.assertEqual(task.delay.call_count, 1)
+
+    def test_old_task_names_delegate(self):
+        from .tasks import generate_product_thumbnails
+
+        with mock.patch('backend.thumbnails.generate_thumbnails', return_value=[]) as generate:
+            generate_product_thumbnails('products/photo.jpg')
+        generate.assert_called_once_with('products/photo.jpg', 'backend.Product.image')
+
+
+class ProductSearchTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = Category.objects.create(name='Телефоны')
+        self.cases = Category.objects.create(name='Чехлы')
+        self.shop1 = Shop.objects.create(name='Связной', url='http://a.ru')
+        self.shop2 = Shop.objects.create(name='Ситилинк', url='http://b.ru')
+        color = Parameter.objects.create(name='Цвет')
+        rows = [
+            (self.phones, 'Смартфон Galaxy', 'Большой экран', self.shop1, 500, 'черный'),
+            (self.phones, 'Смартфон Pixel', 'Хорошая камера', self.shop2, 400, 'белый'),
+            (self.cases, 'Чехол для Galaxy', None, self.shop1, 10, 'черный'),
+        ]
+        self.offers = []
+        for category, name, description, shop, price, value in rows:
+            product = Product.objects.create(category=category, name=name, description=description)
+            offer = ProductInfo.objects.create(
+                product=product, shop=shop, name=name[:50], quantity=5, price=price, price_rrc=price,
+            )
+            ProductParameter.objects.create(product_info=offer, parameter=color, value=value)
+            self.offers.append(offer)
+
+    def test_filters_and_facets(self):
+        # фасеты одним запросом, страница с подгрузкой параметров и магазинов категорий
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('product_search'), {'param': 'Цвет:черный', 'price_min': 50})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.offers[0].id])
+        facets = response.data['facets']
+        self.assertEqual(facets['category'], [{'id': self.phones.id, 'name': 'Телефоны', 'count': 1}])
+        self.assertEqual(facets['parameters'], {'Цвет': [{'value': 'черный', 'count': 1}]})
+
+        response = self.client.get(reverse('product_search'), {'shop': self.shop1.id, 'ordering': 'price'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.offers[2].id, self.offers[0].id])
+        self.assertEqual(
+            sorted((item['name'], item['count']) for item in response.data['facets']['category']),
+            [('Телефоны', 1), ('Чехлы', 1)],
+        )
+        response = self.client.get(reverse('product_search'), {'param': 'Цвет'})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', 'полнотекстовый поиск есть только в PostgreSQL')
+    def test_text_search_with_typo_fallback(self):
+        response = self.client.get(reverse('product_search'), {'q': 'galaxy'})
+        self.assertFalse(response.data['fuzzy'])
+        self.assertEqual({row['id'] for row in response.data['results']}, {self.offers[0].id, self.offers[2].id})
+
+        response = self.client.get(reverse('product_search'), {'q': 'камеры'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.offers[1].id])
+
+        response = self.client.get(reverse('product_search'), {'q': 'galaxi'})
+        self.assertTrue(response.data['fuzzy'])
+        self.assertIn(self.offers[0].id, [row['id'] for row in response.data['results']])
+
+
+class BestOfferTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+
+    def goods(self, prices):
+        return [
+            {'category': 224, 'name': f'Товар {i}', 'price': price, 'quantity': 2}
+            for i, price in enumerate(prices)
+        ]
+
+    def test_refreshed_by_import_and_order(self):
+        PriceListImporter('Связной').run(self.goods([300, 100, 200]))
+        PriceListImporter('Ситилинк').run(self.goods([250, 150, 50])[:2])
+        best = BestOffer.objects.get(product__name='Товар 0')
+        self.assertEqual((best.min_price, best.shop.name, best.total_quantity), (250, 'Ситилинк', 4))
+
+        # заказ выкупает самое дешевое предложение, лучшим становится следующее
+        offer = ProductInfo.objects.get(product__name='Товар 1', shop__name='Связной')
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_order'), {
+                'address': 'Москва', 'products_info': [{'product_info_id': offer.id, 'quantity': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        best = BestOffer.objects.get(product__name='Товар 1')
+        self.assertEqual((best.min_price, best.shop.name, best.total_quantity), (150, 'Ситилинк', 2))
+
+    def test_products_sorted_and_filtered_by_best_price(self):
+        PriceListImporter('Связной').run(self.goods([300, 100, 200, 0.5]))
+        ProductInfo.objects.filter(product__name='Товар 3').update(quantity=0)
+        refresh_best_offers(Product.objects.values_list('id', flat=True))
+
+        response = self.client.get(reverse('get_products'), {'ordering': 'price', 'page_size': 2})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Товар 1', 'Товар 2'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['name'] for row in response.data['results']], ['Товар 0'])
+
+        response = self.client.get(reverse('product-list'), {'ordering': '-price', 'price_max': 250})
+        self.assertEqual([row['name'] for row in response.data['results']], ['Товар 2', 'Товар 1'])
+
+
+class AsyncViewsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        PriceListImporter('Связной').run([
+            {'category': 224, 'name': f'Товар {i}', 'price': 100 + i, 'quantity': 5} for i in range(3)
+        ])
+
+    def bearer(self):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def test_catalog_matches_sync_views(self):
+        product = Product.objects.order_by('id').first()
+        response = self.client.get(reverse('async_product_list'), {'page_size': 2})
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Товар 0', 'Товар 1'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Товар 2'])
+        self.assertIsNone(response.json()['next'])
+
+        response = self.client.get(reverse('async_product_detail', args=[product.id]))
+        self.assertEqual(response.json(), self.client.get(reverse('product-detail', args=[product.id])).json())
+
+    def test_offers_filtered_by_shop(self):
+        PriceListImporter('Ситилинк').run([{'category': 224, 'name': 'Товар 0', 'price': 90, 'quantity': 1}])
+        shop = Shop.objects.get(name='Ситилинк')
+        response = self.client.get(reverse('async_product_info_list'), {'shop': shop.id})
+        self.assertEqual([row['price'] for row in response.json()['results']], ['90.00'])
+        response = self.client.get(reverse('async_product_info_list'), {'shop': 'все'})
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_orders_and_cart_need_token(self):
+        offer = ProductInfo.objects.first()
+        order = Order.objects.create(user=self.user, address='Москва')
+        OrderItem.objects.create(order=order, product=offer, shop=offer.shop, quantity=1)
+
+        self.assertEqual(self.client.get(reverse('async_order_list')).status_code, 401)
+        response = self.client.get(reverse('async_order_list'), **self.bearer())
+        self.assertEqual([row['id'] for row in response.json()['results']], [order.id])
+        response = self.client.get(reverse('async_order_detail', args=[order.id]), **self.bearer())
+        self.assertEqual(response.json()['items'][0]['quantity'], 1)
+        response = self.client.get(reverse('async_cart'), **self.bearer())
+        self.assertEqual(response.json()['items'], [])
+
+
+class ScopedCacheTest(APITestCase):
+    def setUp(self):
+        from .metrics import counters
+
+        counters.flush()
+        cache.clear()
+        self.buyer = User.objects.create_user(username='buyer', password='testpass', email='buyer@test.com')
+        self.other = User.objects.create_user(username='other', password='testpass', email='other@test.com')
+        PriceListImporter('Связной').run([{'category': 224, 'name': 'Товар', 'price': 100, 'quantity': 5}])
+        PriceListImporter('Ситилинк').run([{'category': 224, 'name': 'Товар', 'price': 120, 'quantity': 5}])
+
+    def hits(self, namespace):
+        from .metrics import _series, counters
+        return counters.snapshot().get(_series('scoped_cache_requests_total', {'namespace': namespace, 'result': 'hit'}), 0)
+
+    def get(self, user, url, data=None):
+        self.client.force_authenticate(user)
+        return self.client.get(url, data)
+
+    def test_cart_write_evicts_only_owner(self):
+        offer = ProductInfo.objects.get(shop__name='Связной')
+        self.get(self.buyer, reverse('get_cart'))
+        self.get(self.other, reverse('get_cart'))
+        self.get(self.other, reverse('get_cart'))
+        self.assertEqual(self.hits('cart'), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_authenticate(self.buyer)
+            self.client.post(reverse('add_to_cart'), {'product_info_id': offer.id}, format='json')
+        self.assertEqual(len(self.get(self.buyer, reverse('get_cart')).data['items']), 1)
+        self.assertEqual(self.get(self.other, reverse('get_cart')).data['items'], [])
+        self.assertEqual(self.hits('cart'), 2)
+
+    def test_import_evicts_only_its_shop(self):
+        shops = dict(Shop.objects.values_list('name', 'id'))
+        self.get(self.buyer, reverse('product_info_list'), {'shop': shops['Связной']})
+        self.get(self.buyer, reverse('product_info_list'), {'shop': shops['Ситилинк']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceListImporter('Связной').run([{'category': 224, 'name': 'Товар', 'price': 90, 'quantity': 5}])
+        response = self.get(self.buyer, reverse('product_info_list'), {'shop': shops['Связной']})
+        self.assertEqual([row['price'] for row in response.data['results']], ['90.00'])
+        response = self.get(self.buyer, reverse('product_info_list'), {'shop': shops['Ситилинк']})
+        self.assertEqual([row['price'] for row in response.data['results']], ['120.00'])
+        self.assertEqual(self.hits('offers'), 1)
+
+    def test_order_change_evicts_owner_orders(self):
+        order = Order.objects.create(user=self.buyer, address='Москва', status='pending')
+        url = reverse('order-details', args=[order.id])
+        self.assertEqual(self.get(self.buyer, url).data['status'], 'pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'confirmed'
+            order.save()
+        self.assertEqual(self.get(self.buyer, url).data['status'], 'confirmed')
+        self.assertEqual(self.get(self.other, url).status_code, 404)
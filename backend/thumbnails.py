@@ -0,0 +1,90 @@
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from easy_thumbnails import engine, utils
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.files import ThumbnailFile, get_thumbnailer
+
+THUMBNAIL_QUEUED_KEY = 'thumbs:queued:{}'
+THUMBNAIL_SOURCE_KEY = 'thumbs:source:{}'
+
+# Миниатюры строятся одной задачей на исходник: задача ставится, только если
+# файл изменился с прошлой генерации (размер и время изменения в хранилище),
+# и не ставится повторно, пока предыдущая для того же файла не началась.
+# Исходник декодируется один раз на все алиасы.
+
+
+def source_fingerprint(name):
+    try:
+        return f'{default_storage.size(name)}:{default_storage.get_modified_time(name).timestamp()}'
+    except (OSError, NotImplementedError):
+        return None
+
+
+def schedule_thumbnails(fieldfile):
+    """Ставит миниатюры файла поля в очередь; False, если делать нечего."""
+    if not fieldfile:
+        return False
+    name = fieldfile.name
+    fingerprint = source_fingerprint(name)
+    if fingerprint is not None and cache.get(THUMBNAIL_SOURCE_KEY.format(name)) == fingerprint:
+        return False
+    if not cache.add(THUMBNAIL_QUEUED_KEY.format(name), 1, timeout=getattr(settings, 'THUMBNAIL_QUEUE_TTL', 600)):
+        return False
+    from .tasks import generate_thumbnails
+    target = f'{fieldfile.instance._meta.label}.{fieldfile.field.name}'
+    transaction.on_commit(lambda: generate_thumbnails.delay(name, target))
+    return True
+
+
+def generate_thumbnails(name, target=None):
+    """Все алиасы для исходника name за одно декодирование; возвращает имена созданных миниатюр."""
+    # изменения файла во время генерации поставят следующую задачу
+    cache.delete(THUMBNAIL_QUEUED_KEY.format(name))
+    fingerprint = source_fingerprint(name)
+    thumbnailer = get_thumbnailer(name)
+    missing = {}
+    for alias, options in aliases.all(target, include_global=True).items():
+        options = thumbnailer.get_options({**options, 'ALIAS': alias})
+        if not thumbnailer.get_existing_thumbnail(options):
+            missing[alias] = options
+
+    created = []
+    if missing:
+        # draft JPEG по наибольшему размеру подходит всем алиасам
+        largest = max(missing.values(), key=lambda options: max(options['size']))
+        source = engine.generate_source_image(thumbnailer, largest, thumbnailer.source_generators, fail_silently=False)
+        if source is None:
+            raise ValueError(f'Файл не является изображением: {name}')
+        for options in missing.values():
+            created.append(_save_thumbnail(thumbnailer, source, options))
+
+    if fingerprint is not None:
+        cache.set(THUMBNAIL_SOURCE_KEY.format(name), fingerprint, timeout=None)
+    return created
+
+
+def _save_thumbnail(thumbnailer, source, options):
+    # хвост Thumbnailer.generate_thumbnail без повторного открытия исходника
+    image = engine.process_image(source, options, thumbnailer.thumbnail_processors)
+    filename = thumbnailer.get_thumbnail_name(options, transparent=utils.is_transparent(image))
+    if os.path.splitext(thumbnailer.name)[1][1:].lower() == 'svg':
+        data = engine.save_svg_image(image, filename=filename).read()
+    else:
+        data = engine.save_pil_image(
+            image, filename=filename, quality=options['quality'], subsampling=options['subsampling'],
+            keep_icc_profile=options.get('keep_icc_profile', False),
+        ).read()
+    if not isinstance(data, bytes):
+        data = data.encode()
+    thumbnail = ThumbnailFile(
+        filename, file=ContentFile(data), storage=thumbnailer.thumbnail_storage, thumbnail_options=options,
+    )
+    thumbnail.image = image
+    thumbnail._committed = False
+    thumbnailer.save_thumbnail(thumbnail)
+    return filename
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
-from . import views
+from . import async_views, views
 from .views import (
     CategoryViewSet,
     ProductViewSet,
@@ -13,6 +13,8 @@ from .views import (
     get_products,
     import_products,
     ProductInfoListView,
+    CatalogSnapshotView,
+    ProductSearchView,
     ContactListCreateView,
     ContactDestroyView,
     CreateOrderView,
@@ -40,6 +42,9 @@ urlpatterns = [
     path('import-products/', import_products, name='import_products'),
 
     path('product-info/', ProductInfoListView.as_view(), name='product_info_list'),
+    path('catalog/products/', CatalogSnapshotView.as_view(kind='products'), name='catalog_products'),
+    path('catalog/offers/', CatalogSnapshotView.as_view(kind='offers'), name='catalog_offers'),
+    path('search/', ProductSearchView.as_view(), name='product_search'),
 
     path('contacts/', ContactListCreateView.as_view(), name='contacts_list_create'),
     path('contacts/<int:pk>/', ContactDestroyView.as_view(), name='contact_delete'),
@@ -55,4 +60,12 @@ urlpatterns = [
     path('cart/', views.get_cart, name='get_cart'),
     path('cart/item/<int:item_id>/update/', views.update_cart_item, name='update_cart_item'),
     path('cart/item/<int:item_id>/delete/', views.remove_from_cart, name='remove_from_cart'),
+
+    # асинхронные чтения для ASGI (backend/async_views.py)
+    path('async/products/', async_views.product_list, name='async_product_list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async_product_detail'),
+    path('async/product-info/', async_views.product_info_list, name='async_product_info_list'),
+    path('async/orders/', async_views.order_list, name='async_order_list'),
+    path('async/orders/<int:pk>/', async_views.order_detail, name='async_order_detail'),
+    path('async/cart/', async_views.cart, name='async_cart'),
 ]
\ No newline at end of file
@@ -3,8 +3,8 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
-from django.core.mail import send_mail
 from orders.email_settings import EMAIL_HOST_USER
+from orders.tasks import queue_email
 
 
 def send_activation_email(request, user):
@@ -18,10 +18,9 @@ def send_activation_email(request, user):
     activation_path = reverse('activate', kwargs={'uidb64': uidb64, 'token': token})
     activation_link = f"http://{domain}{activation_path}"
 
-    send_mail(
+    queue_email(
         'Подтверждение регистрации',
         f'Перейдите по ссылке для подтверждения: {activation_link}',
         EMAIL_HOST_USER,
         [user.email],
-        fail_silently=False,
     )
\ No newline at end of file
@@ -1,11 +1,15 @@
+import json
+import time
+import uuid
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import send_mail
-from django.http import HttpResponse
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode
 from django.utils.http import urlsafe_base64_encode
@@ -16,31 +20,45 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from django.views.generic import TemplateView
 from rest_framework_simplejwt.views import TokenObtainPairView
-from orders.tasks import send_order_confirmation_email
+from orders.tasks import queue_email, queue_bulk_email, queue_order_confirmation
 
 from .models import (
-    Product,
     Category,
     Shop,
     Order,
-    OrderItem,
-    ProductInfo,
     Contact,
-    Cart,
-    CartItem
+    ImportJob
 )
+from .attributes import filter_by_attributes
+from .carts import get_cart_store
+from .idempotency import idempotent
+from .offers import best_offer_products
+from .catalog import catalog_products, catalog_offers, get_catalog_version, render_snapshot
+from .export import EXPORT_FORMATS, gzip_stream
+from .pagination import CatalogCursorPagination, OrderCursorPagination
+from .reads import orders_with_items, order_rows, orders_data
+from .scoped_cache import cached, evict, request_key
 from .serializers import (
     ProductSerializer,
+    ProductInfoDetailSerializer,
     CategorySerializer,
     ShopSerializer,
     OrderSerializer,
+    OrderPlaceSerializer,
     UserSerializer,
     ContactSerializer,
-    CartSerializer,
+    ImportJobSerializer,
+    ProductSearchQuerySerializer,
 )
+from .search import search_offers
+from .tasks import run_import_job
 
 User = get_user_model()
 
+# сколько секунд статус импорта может ждать завершения задачи (?wait=): ожидание
+# занимает воркер, поэтому долгие импорты клиент опрашивает сам
+IMPORT_JOB_MAX_WAIT = 2
+
 def initial_page(request):
     return HttpResponse('Welcome to the web service for ordering goods!')
 
@@ -55,7 +73,7 @@ def send_activation_email(request, user):
     from_email = settings.EMAIL_HOST_USER
     recipient_list = [user.email]
 
-    send_mail(subject, message, from_email, recipient_list)
+    queue_email(subject, message, from_email, recipient_list)
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -71,12 +89,36 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     permission_classes = [permissions.AllowAny]
 
 class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.all()
+    queryset = catalog_products()
     serializer_class = ProductSerializer
+    pagination_class = CatalogCursorPagination
 
 class ProductInfoListView(generics.ListAPIView):
-    queryset = ProductInfo.objects.select_related('product', 'shop').all()
-    serializer_class = ProductSerializer
+    """
+    Предложения магазинов; ?param=Цвет:черный&param=Память:128 — только с этими
+    параметрами, ?shop=<id> — только одного магазина.
+    """
+    queryset = catalog_offers()
+    serializer_class = ProductInfoDetailSerializer
+    pagination_class = CatalogCursorPagination
+
+    def get_queryset(self):
+        params = [item.split(':', 1) for item in self.request.query_params.getlist('param') if ':' in item]
+        offers = filter_by_attributes(super().get_queryset(), params)
+        if self.shop_id() is not None:
+            offers = offers.filter(shop_id=self.shop_id())
+        return offers
+
+    def shop_id(self):
+        shop = self.request.query_params.get('shop', '')
+        return int(shop) if shop.isdigit() else None
+
+    def list(self, request, *args, **kwargs):
+        # ?shop= — страницы предложений магазина кэшируются до записи в его предложения
+        return Response(cached(
+            'offers', self.shop_id(), request_key(request), lambda: super(ProductInfoListView, self).list(
+                request, *args, **kwargs).data,
+        ))
 
 class ContactListCreateView(generics.ListCreateAPIView):
     serializer_class = ContactSerializer
@@ -100,30 +142,27 @@ class UserOrdersListView(generics.ListAPIView):
         return Order.objects.filter(user=self.request.user).order_by('-dt')
 
 class CreateOrderView(generics.CreateAPIView):
-    serializer_class = OrderSerializer
+    serializer_class = OrderPlaceSerializer
     permission_classes = [IsAuthenticated]
 
+    # повтор оформления с тем же Idempotency-Key не создает второй заказ
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
     def perform_create(self, serializer):
+        # заказ, списание остатков и позиции создаются в place_order одной транзакцией
         order = serializer.save(user=self.request.user)
+        # при оформлении корзина из Redis сразу переносится в таблицы
+        get_cart_store(self.request.user).flush()
         recipient_emails = [self.request.user.email] if self.request.user.is_authenticated and hasattr(
             self.request.user, 'email') else []
 
-        products_info = serializer.validated_data.get('products_info', [])
-        for item in products_info:
-            product_info_id = item.get('product_info_id')
-            quantity = item.get('quantity', 1)
-            try:
-                product_info = ProductInfo.objects.get(id=product_info_id)
-                OrderItem.objects.create(order=order, product_info=product_info, quantity=quantity)
-            except ProductInfo.DoesNotExist:
-                continue
-
-        send_mail(
+        queue_bulk_email(
             subject='Подтверждение заказа',
             message=f'Ваш заказ #{order.id} создан. Адрес доставки: {order.address}',
             from_email='alina.step@mail.ru',
             recipient_list=recipient_emails,
-            fail_silently=False,
         )
 
 class OrderConfirmUpdateView(generics.UpdateAPIView):
@@ -131,99 +170,229 @@ class OrderConfirmUpdateView(generics.UpdateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def patch(self, request, *args, **kwargs):
-        order_id = kwargs.get('pk')
-        try:
-            order = self.get_queryset().get(pk=order_id, user=request.user)
-        except Order.DoesNotExist:
+        orders = self.get_queryset().filter(pk=kwargs.get('pk'), user=request.user)
+        # подтверждение — условный UPDATE, повторный запрос ничего не меняет
+        if orders.filter(is_confirmed=False).update(is_confirmed=True):
+            evict('orders', request.user.id)
+            return Response({'detail': 'Заказ подтвержден.'})
+
+        if not orders.exists():
             return Response({'detail': 'Заказ не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'detail': 'Заказ уже подтвержден.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if order.is_confirmed:
-            return Response({'detail': 'Заказ уже подтвержден.'}, status=status.HTTP_400_BAD_REQUEST)
+class FlatOrderListMixin:
+    """
+    Список заказов через плоское чтение (API_FLAT_READS), ответ тот же, что у
+    OrderSerializer. Если get_cache_scope() вернул владельца, страницы списка
+    кэшируются до изменения его заказов; названия и цены предложений в позициях
+    при этом могут отставать не дольше SCOPED_CACHE_TTL.
+    """
 
-        order.is_confirmed = True
-        order.confirmed_at = timezone.now()
-        order.save()
+    def get_cache_scope(self):
+        return None
 
-        return Response({'detail': 'Заказ подтвержден.'})
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'API_FLAT_READS', True):
+            return super().list(request, *args, **kwargs)
+        return Response(cached(
+            'orders', self.get_cache_scope(), request_key(request), lambda: self.flat_list(request).data,
+        ))
 
-class ListOrdersView(generics.ListAPIView):
+    def flat_list(self, request):
+        rows = order_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(orders_data(list(rows), self.get_serializer_context()))
+        return self.get_paginated_response(orders_data(page, self.get_serializer_context()))
+
+class ListOrdersView(FlatOrderListMixin, generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return orders_with_items().filter(user=self.request.user)
+
+    def get_cache_scope(self):
+        return self.request.user.id
 
-# Вьюха для импорта товаров
+# Вьюха для импорта товаров: прайс-лист сохраняется, импорт идет в фоне через Celery
 @api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
 def import_products(request):
     if request.method == 'POST':
         data = request.data
-        for item in data.get('goods', []):
-            category_id = item['category']
-            category_name_map = {
-                224: 'Смартфоны',
-                15: 'Аксессуары',
-                1: 'Flash-накопители',
-                5: 'Телевизоры'
-            }
-            category_name = category_name_map.get(category_id, f'Категория {category_id}')
-            category, created = Category.objects.get_or_create(name=category_name)
+        if not isinstance(data, dict) or not isinstance(data.get('goods'), list):
+            return Response({'error': 'Ожидается JSON с полем goods'}, status=status.HTTP_400_BAD_REQUEST)
 
-            product_name = item['name']
-            description = ''
-            price = item['price']
+        job = ImportJob(
+            user=request.user,
+            shop=str(data.get('shop') or 'Default Shop')[:50],
+        )
+        # потоковый read_feed читает шапку до goods, поэтому goods пишется последним
+        payload = {**{key: value for key, value in data.items() if key != 'goods'}, 'goods': data['goods']}
+        job.payload.save(f'{uuid.uuid4().hex}.json', ContentFile(json.dumps(payload).encode('utf-8')))
+        transaction.on_commit(lambda: run_import_job.delay(job.id))
+
+        return Response({
+            'status': 'Импорт поставлен в очередь',
+            'job_id': job.id,
+            'status_url': reverse('import-job-status', args=[job.id]),
+        }, status=status.HTTP_202_ACCEPTED)
+    return Response({'error': 'Метод не разрешен'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-            product, created = Product.objects.get_or_create(
-                name=product_name,
-                defaults={'category': category, 'description': description}
-            )
+class ImportJobStatusView(generics.RetrieveAPIView):
+    serializer_class = ImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
-            shop_name = data.get('shop', 'Default Shop')
-            shop, _ = Shop.objects.get_or_create(name=shop_name)
-
-            ProductInfo.objects.update_or_create(
-                product=product,
-                shop=shop,
-                defaults={
-                    'name': product_name,
-                    'quantity': item.get('quantity', 0),
-                    'price': price,
-                    'price_rrc': item.get('price_rrc', price)
-                }
-            )
+    # чужие задачи отдают 404, как несуществующие
+    def get_queryset(self):
+        return ImportJob.objects.filter(user=self.request.user)
 
-        return Response({'status': 'Импорт завершен'}, status=status.HTTP_201_CREATED)
-    return Response({'error': 'Метод не разрешен'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        try:
+            wait = min(float(request.query_params.get('wait', 0)), IMPORT_JOB_MAX_WAIT)
+        except ValueError:
+            wait = 0
+
+        # ?wait=N — ждем завершения импорта не дольше N секунд
+        deadline = time.monotonic() + wait
+        while not job.is_finished and time.monotonic() < deadline:
+            time.sleep(0.5)
+            job.refresh_from_db()
+
+        return Response(self.get_serializer(job).data)
 
 # Вьюха для получения списка товаров
 @api_view(['GET'])
 def get_products(request):
-    products = Product.objects.all()
+    paginator = CatalogCursorPagination()
+    products, ordering = best_offer_products(catalog_products(), request.query_params)
+    if ordering:
+        paginator.ordering = ordering
+    products = paginator.paginate_queryset(products, request)
     serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    return paginator.get_paginated_response(serializer.data)
 
 class ExportProductsView(APIView):
+    """
+    Выгрузка каталога. С ?stream=ndjson или ?stream=csv отдается потоком
+    по пачкам товаров; при Accept-Encoding: gzip поток сжимается на лету.
+    """
+    def get(self, request):
+        products = catalog_products()
+        stream = request.query_params.get('stream')
+        if stream is None:
+            serializer = ProductSerializer(products, many=True)
+            return Response(serializer.data)
+
+        if stream not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'Формат выгрузки: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        export, content_type, extension = EXPORT_FORMATS[stream]
+        content = export(products.order_by('id'), context={'request': request})
+
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = StreamingHttpResponse(
+            gzip_stream(content) if use_gzip else content,
+            content_type=f'{content_type}; charset=utf-8',
+        )
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Vary'] = 'Accept-Encoding'
+        response['Content-Disposition'] = f'attachment; filename="products.{extension}"'
+        return response
+
+class CatalogSnapshotView(APIView):
+    """
+    Каталог из предсобранного снимка в кэше: товары (?category=) или
+    предложения магазинов (?shop=&category=). ETag меняется вместе с версией каталога.
+    """
+    kind = 'products'
+
+    def get(self, request):
+        try:
+            filters = {
+                name: int(request.query_params[name])
+                for name in ('shop', 'category') if request.query_params.get(name)
+            }
+        except ValueError:
+            return Response({'error': 'shop и category должны быть числами'}, status=status.HTTP_400_BAD_REQUEST)
+
+        version = get_catalog_version()
+        etag = '"{}-{}-{}-{}"'.format(self.kind, version, filters.get('shop', ''), filters.get('category', ''))
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(render_snapshot(self.kind, version, **filters), content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+class ProductSearchView(APIView):
+    """
+    Поиск предложений по тексту (название и описание товара), категориям,
+    магазинам, цене и параметрам. Вместе со страницей результатов отдаются
+    фасеты по категориям, магазинам и параметрам; fuzzy — найдено по опечаткам.
+    """
+    permission_classes = [permissions.AllowAny]
+
     def get(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        query = ProductSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        found = search_offers(
+            q=data['q'].strip(),
+            ordering=data['ordering'],
+            limit=data['limit'],
+            offset=data['offset'],
+            categories=data['category'],
+            shops=data['shop'],
+            price_min=data.get('price_min'),
+            price_max=data.get('price_max'),
+            params=data['param'],
+        )
+        found['results'] = ProductInfoDetailSerializer(found['results'], many=True, context={'request': request}).data
+        return Response(found)
 
 class CategoryViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
 class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+    """
+    API endpoint для работы с продуктами.
+    """
+    queryset = catalog_products()
     serializer_class = ProductSerializer
+    pagination_class = CatalogCursorPagination
+    # иначе products/list/ перехватывается как карточка товара с pk="list"
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        # ?ordering=price, ?in_stock=1, ?price_min= — по лучшему предложению
+        queryset, ordering = best_offer_products(queryset, self.request.query_params)
+        if ordering:
+            self.paginator.ordering = ordering
+        return queryset
 
 class ShopViewSet(viewsets.ModelViewSet):
     queryset = Shop.objects.all()
     serializer_class = ShopSerializer
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(FlatOrderListMixin, viewsets.ModelViewSet):
+    queryset = orders_with_items()
     serializer_class = OrderSerializer
+    pagination_class = OrderCursorPagination
+    # иначе orders/create/ перехватывается как заказ с pk="create"
+    lookup_value_regex = r'\d+'
 
 def activate(request, uidb64, token):
     try:
@@ -239,72 +408,53 @@ def activate(request, uidb64, token):
     else:
         return HttpResponse('Некорректная ссылка или срок действия истек.')
 
-# Работа с корзиной
+# Работа с корзиной: хранилище (SQL или Redis) выбирается настройкой CART_BACKEND
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_cart(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    serializer = CartSerializer(cart)
-    return Response(serializer.data)
+    return Response(get_cart_store(request.user).data())
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def add_to_cart(request):
     product_info_id = request.data.get('product_info_id')
     quantity = int(request.data.get('quantity', 1))
 
     if not product_info_id:
         return Response({'error': 'Product info ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if quantity <= 0:
+        return Response({'error': 'Количество должно быть больше нуля'}, status=status.HTTP_400_BAD_REQUEST)
 
-    try:
-        product_info = ProductInfo.objects.get(id=product_info_id)
-    except ProductInfo.DoesNotExist:
+    if not get_cart_store(request.user).add(product_info_id, quantity):
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product_info=product_info,
-        defaults={'quantity': quantity}
-    )
-
-    if not created:
-        cart_item.quantity += quantity
-        cart_item.save()
-
     return Response({'message': 'Товар добавлен в корзину'})
 
 @api_view(['PUT'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def update_cart_item(request, item_id):
-    try:
-        cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-    except CartItem.DoesNotExist:
+    quantity = int(request.data.get('quantity'))
+    if not get_cart_store(request.user).update(item_id, quantity):
         return Response({'error': 'Элемент не найден'}, status=status.HTTP_404_NOT_FOUND)
 
-    quantity = int(request.data.get('quantity'))
     if quantity <= 0:
-        cart_item.delete()
         return Response({'message': 'Элемент удален из корзины'})
-
-    cart_item.quantity = quantity
-    cart_item.save()
     return Response({'message': 'Количество обновлено'})
 
 @api_view(['DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def remove_from_cart(request, item_id):
-    try:
-        cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
-        cart_item.delete()
+    if get_cart_store(request.user).remove(item_id):
         return Response({'message': 'Элемент удален'})
-    except CartItem.DoesNotExist:
-        return Response({'error': 'Элемент не найден'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'error': 'Элемент не найден'}, status=status.HTTP_404_NOT_FOUND)
 
 class SendOrderConfirmationView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, order_id):
         try:
             order = Order.objects.get(id=order_id, user=request.user)
@@ -327,7 +477,7 @@ class SendOrderConfirmationView(APIView):
         # отправляем письмо с ссылкой
         subject = 'Подтверждение заказа'
         message = f'Для подтверждения заказа перейдите по ссылке: {confirm_url}'
-        send_mail(subject, message, settings.EMAIL_HOST_USER, [request.user.email])
+        queue_email(subject, message, settings.EMAIL_HOST_USER, [request.user.email])
 
         return Response({'message': 'Письмо с подтверждением отправлено'})
 
@@ -338,21 +488,20 @@ class ConfirmOrderByLinkView(APIView):
         try:
             order_id_str = urlsafe_base64_decode(uidb64).decode()
             order_id = int(order_id_str)
-            order = Order.objects.get(id=order_id)
-        except (TypeError, ValueError, OverflowError, Order.DoesNotExist):
+        except (TypeError, ValueError, OverflowError):
             return HttpResponse('Некорректная ссылка или заказ не найден.', status=404)
 
-        # статус "ожидает подтверждения"
-        if order.status != 'pending_confirmation':
+        # подтверждается только заказ в статусе "ожидает подтверждения", одним условным UPDATE:
+        # повторный переход по ссылке не подтверждает заказ и не шлет письмо второй раз
+        confirmed = Order.objects.filter(id=order_id, status='pending_confirmation').update(status='confirmed')
+        if not confirmed:
+            if not Order.objects.filter(id=order_id).exists():
+                return HttpResponse('Некорректная ссылка или заказ не найден.', status=404)
             return HttpResponse('Этот заказ уже подтвержден или недоступен для подтверждения.', status=400)
-
-        # подтверждаем заказ
-        order.status = 'confirmed'
-        order.confirmed_at = timezone.now()
-        order.save()
+        evict('orders', *Order.objects.filter(id=order_id).values_list('user_id', flat=True))
 
         # Вызов асинхронной задачи для уведомления пользователя
-        send_order_confirmation_email.delay(order.id)
+        queue_order_confirmation(order_id)
 
         return HttpResponse('Заказ подтвержден! Спасибо за покупку.')
 
@@ -361,18 +510,17 @@ class OrderDetailAPIView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return orders_with_items().filter(user=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(cached(
+            'orders', request.user.id, f'detail:{kwargs["pk"]}',
+            lambda: super(OrderDetailAPIView, self).retrieve(request, *args, **kwargs).data,
+        ))
 
 class UserOrdersPageView(TemplateView):
     template_name = 'user_orders.html'
 
-class ProductViewSet(viewsets.ModelViewSet):
-    """
-    API endpoint для работы с продуктами.
-    """
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
-
 class CrashTestView(APIView):
     def get(self, request):
         product_id = request.query_params.get('product_id')
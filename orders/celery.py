@@ -1,14 +1,57 @@
 
 from __future__ import absolute_import, unicode_literals
 import os
-from celery import Celery
+import time
+from celery import Celery, signals
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'orders.settings')
 
 app = Celery('backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+# orders не входит в INSTALLED_APPS, почтовые задачи подключаем явно
+app.autodiscover_tasks(['orders'])
 
 @app.task(bind=True)
 def debug_task(self):
-    print(f'Request: {self.request}')
\ No newline at end of file
+    print(f'Request: {self.request}')
+
+# Метрики задач собираются сигналами Celery в те же счетчики, что и метрики
+# запросов (backend.metrics): они видны на /metrics и в команде task_stats.
+# Время постановки в очередь едет в заголовке сообщения.
+
+ENQUEUED_AT_HEADER = 'enqueued_at'
+_started = {}
+
+def _counters():
+    from backend.metrics import counters
+    return counters
+
+@signals.before_task_publish.connect
+def task_enqueued(sender=None, headers=None, **kwargs):
+    # sender здесь — имя задачи
+    if headers is not None:
+        headers.setdefault(ENQUEUED_AT_HEADER, time.time())
+    _counters().add('celery_tasks_published_total', {'task': sender})
+
+@signals.task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+    samples = [('celery_tasks_started_total', {'task': task.name}, 1)]
+    # у воркера заголовки сообщения — поля запроса, при eager-вызове они в request.headers
+    enqueued_at = getattr(task.request, ENQUEUED_AT_HEADER, None) or (task.request.headers or {}).get(ENQUEUED_AT_HEADER)
+    if enqueued_at:
+        samples.append(('celery_task_queue_wait_seconds_total', {'task': task.name}, max(time.time() - enqueued_at, 0)))
+    _counters().add_many(samples)
+
+@signals.task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    samples = [('celery_tasks_total', {'task': task.name, 'state': state or 'UNKNOWN'}, 1)]
+    if started is not None:
+        samples.append(('celery_task_runtime_seconds_total', {'task': task.name}, time.perf_counter() - started))
+    _counters().add_many(samples)
+
+@signals.worker_process_shutdown.connect
+def flush_task_metrics(**kwargs):
+    _counters().flush()
@@ -53,6 +53,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # поиск товаров: SearchVector, GIN-индексы, триграммы
+    'django.contrib.postgres',
 
 
     'rest_framework',
@@ -88,6 +90,8 @@ THUMBNAIL_ALIASES = {
     },
 }
 THUMBNAIL_BASEDIR = 'thumbs'
+# сколько держится флаг «миниатюры уже в очереди», если задача потерялась
+THUMBNAIL_QUEUE_TTL = 600
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -98,6 +102,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    # SQL-запросы, время базы и рендера по маршрутам: заголовок Server-Timing и /metrics
+    'backend.metrics.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'orders.urls'
@@ -185,6 +191,10 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.UserRateThrottle',
     ],
@@ -193,6 +203,17 @@ REST_FRAMEWORK = {
     },
 }
 
+# размер страницы списков по умолчанию, клиент может передать ?page_size=
+API_PAGE_SIZE = 50
+# корзины и списки заказов читаются через values() в обход ModelSerializer, ответ тот же
+API_FLAT_READS = True
+# сколько секунд хранится ответ на запрос с заголовком Idempotency-Key
+IDEMPOTENCY_TTL = 60 * 60 * 24
+# счетчики /metrics сбрасываются в Redis раз в столько секунд; эндпоинт открыт
+# персоналу, а с METRICS_TOKEN — и по заголовку Authorization: Bearer <токен>
+METRICS_FLUSH_INTERVAL = 10
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Backend API',
     'DESCRIPTION': 'Orders API',
@@ -217,6 +238,31 @@ elif USE_TLS:
     EMAIL_USE_TLS = True
     EMAIL_USE_SSL = False
 
+# массовые уведомления: сколько секунд копить письма и сколько отправлять за одно соединение
+MAIL_BATCH_WINDOW = 2
+MAIL_BATCH_SIZE = 100
+
+# хранилище корзин: 'sql' — таблицы Cart/CartItem, 'redis' — хэши Redis с отложенным переносом в таблицы
+CART_BACKEND = 'sql'
+# через сколько секунд после изменения корзина из Redis переносится в таблицы
+CART_FLUSH_DELAY = 30
+CART_REDIS_TTL = 60 * 60 * 24 * 30
+
+# cachalot кэширует только редко меняющиеся таблицы каталога: запись в любую
+# кэшируемую таблицу сбрасывает все запросы к ней у всех пользователей
+CACHALOT_ONLY_CACHABLE_TABLES = frozenset([
+    'backend_shop',
+    'backend_category',
+    'backend_category_shops',
+    'backend_product',
+    'backend_parameter',
+    'backend_productparameter',
+])
+# корзины, заказы и предложения магазинов кэшируются по владельцу (backend/scoped_cache.py),
+# запись сбрасывает кэш только затронутого пользователя или магазина
+SCOPED_CACHE_TTL = 60 * 10
+# пространства, которые не кэшируются: 'cart', 'orders', 'offers'
+SCOPED_CACHE_DISABLED = []
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -1,23 +1,162 @@
 # tasks.py
+import json
+from smtplib import SMTPException
+
 from celery import shared_task
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.db import transaction
+from django.template.loader import get_template
+
+# общие настройки повторов для писем: SMTP может быть медленным или недоступным
+MAIL_RETRY_OPTIONS = {
+    'autoretry_for': (SMTPException, OSError),
+    'retry_backoff': True,
+    'retry_backoff_max': 600,
+    'retry_jitter': True,
+    'max_retries': 5,
+}
+
+MAIL_BUFFER_KEY = 'mail:pending'
+MAIL_FLUSH_KEY = 'mail:flush-scheduled'
+ORDER_CONFIRMATION_TEMPLATE = 'emails/order_confirmation.html'
+
+@shared_task(**MAIL_RETRY_OPTIONS)
+def send_email(subject, message, from_email, recipient_list, html_message=None):
+    send_mail(subject, message, from_email, recipient_list, html_message=html_message, fail_silently=False)
+
+def queue_email(subject, message, from_email, recipient_list, html_message=None):
+    # письмо уходит в очередь только после коммита, чтобы не писать о несохраненных данных
+    recipient_list = [email for email in recipient_list if email]
+    if recipient_list:
+        transaction.on_commit(
+            lambda: send_email.delay(subject, message, from_email, recipient_list, html_message)
+        )
+
+# Массовые уведомления копятся в буфере MAIL_BATCH_WINDOW секунд и уходят
+# пачками по MAIL_BATCH_SIZE писем через одно SMTP-соединение.
+
+def _redis():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+def buffer_notification(kind, **data):
+    redis = _redis()
+    item = json.dumps({'kind': kind, **data})
+    if redis is not None:
+        redis.rpush(MAIL_BUFFER_KEY, item)
+    else:
+        # без Redis (разработка, тесты) буфер живет в обычном кэше и не защищен от гонок
+        cache.set(MAIL_BUFFER_KEY, cache.get(MAIL_BUFFER_KEY, []) + [item], None)
+
+    window = getattr(settings, 'MAIL_BATCH_WINDOW', 2)
+    # сброс планируется один раз на окно, остальные письма к нему присоединяются
+    if cache.add(MAIL_FLUSH_KEY, 1, timeout=window * 10):
+        flush_mail_buffer.apply_async(countdown=window)
+
+def pop_notifications(size):
+    redis = _redis()
+    if redis is not None:
+        pipe = redis.pipeline()
+        pipe.lrange(MAIL_BUFFER_KEY, 0, size - 1)
+        pipe.ltrim(MAIL_BUFFER_KEY, size, -1)
+        items = pipe.execute()[0]
+    else:
+        pending = cache.get(MAIL_BUFFER_KEY, [])
+        items = pending[:size]
+        cache.set(MAIL_BUFFER_KEY, pending[size:], None)
+    return [json.loads(item) for item in items]
 
 @shared_task
-def send_order_confirmation_email(order_id):
+def flush_mail_buffer():
+    # снимаем флаг до чтения буфера: письма, пришедшие во время сброса, запланируют следующий
+    cache.delete(MAIL_FLUSH_KEY)
+    size = getattr(settings, 'MAIL_BATCH_SIZE', 100)
+    batches = 0
+    while True:
+        batch = pop_notifications(size)
+        if not batch:
+            return batches
+        # у каждой пачки свои повторы, сбой SMTP не задерживает остальные
+        send_mail_batch.delay(batch)
+        batches += 1
+
+def build_messages(notifications):
+    """Письма для пачки уведомлений, каждый шаблон загружается один раз."""
+    return [message for _, message in notification_messages(notifications)]
+
+def notification_messages(notifications):
+    """Пары (уведомление, письмо) в порядке уведомлений; уведомления без письма пропускаются."""
     from backend.models import Order
+
+    orders = {}
+    order_ids = [item['order_id'] for item in notifications if item['kind'] == 'order_confirmation']
+    if order_ids:
+        template = get_template(ORDER_CONFIRMATION_TEMPLATE)
+        orders = Order.objects.select_related('user').prefetch_related(
+            'items__product', 'items__shop').in_bulk(order_ids)
+
+    pairs = []
+    for item in notifications:
+        if item['kind'] == 'order_confirmation':
+            # заказ могли удалить, пока письмо ждало в буфере
+            order = orders.get(item['order_id'])
+            if order is None or not order.user.email:
+                continue
+            message = EmailMultiAlternatives(
+                subject='Ваш заказ подтвержден',
+                body='Ваш заказ успешно подтвержден.',
+                from_email=settings.EMAIL_HOST_USER,
+                to=[order.user.email],
+            )
+            message.attach_alternative(template.render({'order': order}), 'text/html')
+        elif item['kind'] == 'email':
+            message = EmailMultiAlternatives(item['subject'], item['message'], item['from_email'], item['to'])
+            if item.get('html_message'):
+                message.attach_alternative(item['html_message'], 'text/html')
+        else:
+            continue
+        pairs.append((item, message))
+    return pairs
+
+@shared_task(bind=True, max_retries=MAIL_RETRY_OPTIONS['max_retries'])
+def send_mail_batch(self, notifications):
+    # одно соединение на всю пачку; при сбое повторяются только неотправленные письма
+    pairs = notification_messages(notifications)
+    sent = delivered = 0
     try:
-        order = Order.objects.get(id=order_id)
-        context = {'order': order}
-        html_content = render_to_string('emails/order_confirmation.html', context)
-
-        email = EmailMultiAlternatives(
-            subject='Ваш заказ подтвержден',
-            body='Ваш заказ успешно подтвержден.',
-            from_email='email@example.ru',
-            to=[order.user.email],
+        with get_connection() as connection:
+            for _, message in pairs:
+                delivered += connection.send_messages([message])
+                sent += 1
+    except MAIL_RETRY_OPTIONS['autoretry_for'] as e:
+        if sent == len(pairs):
+            # все письма ушли, сбой только при закрытии соединения
+            return delivered
+        countdown = get_exponential_backoff_interval(
+            factor=1, retries=self.request.retries,
+            maximum=MAIL_RETRY_OPTIONS['retry_backoff_max'], full_jitter=MAIL_RETRY_OPTIONS['retry_jitter'],
         )
-        email.attach_alternative(html_content, "text/html")
-        email.send()
-    except Order.DoesNotExist:
-        pass
\ No newline at end of file
+        raise self.retry(args=[[item for item, _ in pairs[sent:]]], exc=e, countdown=countdown)
+    return delivered
+
+def queue_bulk_email(subject, message, from_email, recipient_list, html_message=None):
+    recipient_list = [email for email in recipient_list if email]
+    if recipient_list:
+        transaction.on_commit(lambda: buffer_notification(
+            'email', subject=subject, message=message, from_email=from_email,
+            to=recipient_list, html_message=html_message,
+        ))
+
+def queue_order_confirmation(order_id):
+    transaction.on_commit(lambda: buffer_notification('order_confirmation', order_id=order_id))
+
+@shared_task
+def send_order_confirmation_email(order_id):
+    # письмо не отправляется сразу, а ждет пачку в буфере
+    buffer_notification('order_confirmation', order_id=order_id)
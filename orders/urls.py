@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
 from backend.views import CrashTestView
+from backend.metrics import metrics_view
 
-from backend.views import initial_page, import_products, ExportProductsView, activate
+from backend.views import initial_page, import_products, ImportJobStatusView, ExportProductsView, activate
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
 urlpatterns = [
@@ -15,6 +16,7 @@ urlpatterns = [
     # Экспорт/импорт, если они относятся к API — полезно их сюда включить
     path('api/export/products/', ExportProductsView.as_view(), name='export-products'),
     path('api/import/products/', import_products, name='import-products'),
+    path('api/import/jobs/<int:pk>/', ImportJobStatusView.as_view(), name='import-job-status'),
 
     # Активация вне API
     path('activate/<uidb64>/<token>/', activate, name='activate'),
@@ -27,5 +29,6 @@ urlpatterns = [
     path('api/auth/registration/', include('dj_rest_auth.registration.urls')),  # регистрация
     path('api/auth/social/', include('allauth.socialaccount.urls')),  # social auth!
     path('crash-test/', CrashTestView.as_view(), name='crash-test'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 